@@ -22,16 +22,25 @@
 """
 SimpleSwitch 2.0 (SS2) ACL Controller Application
 
+Installs the rules configured in the `ACL/<name>` subsections in to table_acl.
+Every rule gets its own cookie: the rule number in the upper 32 bits and the
+ACL cookie in the lower 32 bits. With rule_stats enabled, the hit counters of
+all rules on a datapath are collected with a single flow stats request
+filtered on the ACL cookie, and summed over all datapaths.
+
 TODO: Diagram the table structure used here
 """
 
-from . import config, util
-from .app import SS2App
+import itertools
+from . import config
+from .app import APP_COOKIE_MASK, SS2App
+from .stats import RuleCounters
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
-from ryu.lib.packet import ethernet, ether_types as ether, packet
+from ryu.lib import hub
 from ryu.ofproto import ofproto_v1_3
 
 
@@ -42,7 +51,15 @@ class SS2ACL(app_manager.RyuApp, SS2App):
     def __init__(self, *args, **kwargs):
         super(SS2ACL, self).__init__(*args, **kwargs)
         self.configParser = config.get_parser()
-        self.config = config.read_config("ACL")
+        self.config = config.read_config(section="ACL")
+        self.rules = self.get_ACL_rules()
+        self.datapaths = {}
+        # Packet and byte counts by rule of flow stats replies still in
+        # progress, by datapath and request xid
+        self.flow_stats = {}
+        self.counters = RuleCounters()
+        if self.config.rule_stats:
+            self.stats_thread = hub.spawn(self.stats_loop)
 
 
     ## Event Handlers
@@ -51,9 +68,48 @@ class SS2ACL(app_manager.RyuApp, SS2App):
     def switch_features_handler(self, ev):
         "Handle new datapaths attaching to Ryu"
         dp = ev.msg.datapath
+        self.datapaths[dp.id] = dp
 
         self.send_msgs(dp, self.add_datapath(dp))
 
+    @set_ev_cls(ofp_event.EventOFPStateChange, DEAD_DISPATCHER)
+    def state_change_handler(self, ev):
+        "Forget datapaths that disconnect from Ryu"
+
+        dpid = ev.datapath.id
+        if dpid == None or self.datapaths.get(dpid) is not ev.datapath:
+            return
+
+        del self.datapaths[dpid]
+        self.counters.remove_datapath(dpid)
+        for key in list(self.flow_stats.keys()):
+            if key[0] == dpid:
+                del self.flow_stats[key]
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def flow_stats_reply_handler(self, ev):
+        "Collect rule hit counters from the stats requested by stats_loop"
+
+        dp = ev.msg.datapath
+        # Other apps request flow stats too, only handle replies to ours
+        counts = self.flow_stats.get((dp.id, ev.msg.xid), None)
+        if counts == None:
+            return
+
+        for stats in ev.msg.body:
+            if stats.cookie & APP_COOKIE_MASK != self.config.cookie:
+                continue
+            rule_id = stats.cookie >> 32
+            packet_count, byte_count = counts.get(rule_id, (0, 0))
+            counts[rule_id] = (packet_count + stats.packet_count,
+                               byte_count + stats.byte_count)
+
+        if ev.msg.flags & dp.ofproto.OFPMPF_REPLY_MORE:
+            return
+
+        del self.flow_stats[(dp.id, ev.msg.xid)]
+        self.counters.update(dp.id, counts)
+
     ## Instance Helper Methods
 
     def add_datapath(self, dp):
@@ -65,19 +121,163 @@ class SS2ACL(app_manager.RyuApp, SS2App):
 
     def add_default_flows(self, dp):
         "Add ACL rules from configuration"
-        rules = self.get_ACL_rules()
         msgs = []
-        for rule in rules:
+        for rule in self.rules:
             msgs += self.get_flows_for_rule(dp, rule)
 
         return msgs
 
+    def get_flows_for_rule(self, dp, rule):
+        "Generate the flowmods of an ACLRule, with the rule's cookie"
+
+        return [self.flowmod(dp, self.config.table_acl, cookie=rule.cookie,
+                             **flow)
+                for flow in rule.to_flows(dp)]
+
     def get_ACL_rules(self):
-        "Returns a list of ACLRule instances from the config file"
+        """Returns a list of ACLRule instances from the config file
+
+        Rules are numbered in the order of their subsections, including the
+        rules that are not enabled, so disabling a rule does not change the
+        cookies of the others. Rules without match fields would match every
+        packet and are skipped.
+        """
+
+        rules = []
+        sections = config.get_subsections(self.configParser, "ACL")
+        for rule_id, section in enumerate(sections, 1):
+            data = config.parse_types(config.get_section(self.configParser,
+                                                         section))
+            if not data.enabled:
+                continue
+            data['rule_id'] = rule_id
+            data['name'] = section.split("/", 1)[1]
+            data['cookie'] = (rule_id << 32) | self.config.cookie
+            rule = ACLRule(**data)
+            if not rule.match_fields():
+                self.logger.warning("Skipping ACL rule %s without match "
+                                    "fields", rule.name)
+                continue
+            rules.append(rule)
+        return rules
+
+    def stats_loop(self):
+        """Periodically request the rule hit counters of every datapath
+
+        Uses one flow stats request per datapath, filtered by the ACL cookie,
+        rather than one request per rule.
+        """
+
+        while True:
+            for dp in list(self.datapaths.values()):
+                self.send_msgs(dp, self.rule_stats_requests(dp))
+            hub.sleep(self.config.rule_stats_interval)
+
+    def rule_stats_requests(self, dp):
+        "Generate the flow stats request for the flows of all rules"
+
+        ofp = dp.ofproto
+        msg = dp.ofproto_parser.OFPFlowStatsRequest(
+            dp, 0, self.config.table_acl, ofp.OFPP_ANY, ofp.OFPG_ANY,
+            self.config.cookie, APP_COOKIE_MASK, self.match(dp))
+        self.flow_stats[(dp.id, dp.set_xid(msg))] = {}
+        return [msg]
+
+    def rule_counters(self):
+        """Returns the hit counters of every rule over all datapaths
+
+        Returns a list of dicts with the rule, its name and the counters from
+        RuleCounters.totals, in the order of the rules.
+        """
+
+        totals = self.counters.totals()
+        counters = []
+        for rule in self.rules:
+            counter = {'rule': rule.rule_id, 'name': rule.name,
+                       'packet_count': 0, 'byte_count': 0,
+                       'packet_rate': None, 'byte_rate': None,
+                       'datapaths': 0}
+            counter.update(totals.get(rule.rule_id, {}))
+            counters.append(counter)
+        return counters
 
 class ACLRule(object):
+    "An ACL rule from an ACL/<name> config subsection"
+
     def __init__(self, **data):
         self.data = data
+        self.rule_id = data['rule_id']
+        self.name = data['name']
+        self.cookie = data['cookie']
+
+    def match_fields(self):
+        """Returns the match fields of the rule
+
+        Returns a sorted list with the list of (field, value) tuples of each
+        match field, one tuple per value.
+        """
+
+        fields = []
+        for field, value in sorted(self.data.get('match', {}).items()):
+            if field == 'parser':
+                # Set by config.AttrDict, not a match field
+                continue
+            fields.append([(field, v) for v in self.parse_values(value)])
+        return fields
 
     def to_flows(self, dp):
-        "Return a list of flowmod data dicts for this rule"
+        """Return a list of flowmod data dicts for this rule
+
+        A match field with several values adds one flow per value, and one
+        flow per combination of values if there are several such fields.
+        """
+
+        fields = self.match_fields()
+        if not fields:
+            raise ValueError("ACL rule %s has no match fields" % self.name)
+
+        action = self.data['action']
+        if action == "allow":
+            instructions = [dp.ofproto_parser.OFPInstructionGotoTable(
+                self.data['table_l2_switch'])]
+        elif action == "drop":
+            instructions = []
+        else:
+            raise ValueError("Unknown action %s for ACL rule %s" %
+                             (action, self.name))
+
+        priority = self.data['priority_base'] + self.data['priority']
+        return [{'match': dp.ofproto_parser.OFPMatch(**dict(match)),
+                 'priority': priority,
+                 'instructions': instructions}
+                for match in itertools.product(*fields)]
+
+    @staticmethod
+    def parse_values(value):
+        """Parse a match value in to a list of values
+
+        Strings are split on commas, and a value/mask becomes a (value, mask)
+        tuple. Numbers in strings are converted.
+        """
+
+        def _number(text):
+            "Convert text to an int if it is a number"
+            try:
+                return int(text, 0)
+            except ValueError:
+                return text
+
+        if not isinstance(value, str):
+            return [value]
+
+        values = []
+        for entry in value.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            if "/" in entry:
+                entry, mask = entry.split("/")
+                values.append((_number(entry), _number(mask)))
+            else:
+                values.append(_number(entry))
+        return values
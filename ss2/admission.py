@@ -0,0 +1,123 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Datapath admission control for Simple Switch 2.0 (SS2)
+"""
+
+import collections
+import logging
+import time
+
+class AdmissionScheduler(object):
+    """Limits the number of datapaths being programmed at the same time
+
+    Datapaths are started in the order they connected, at most concurrency
+    at a time. A datapath is done when it confirms its programming or after
+    timeout seconds. The time from the first datapath of a burst of connects
+    to the last one being done is kept in last_burst.
+    """
+
+    def __init__(self, concurrency, timeout):
+        # {key: time queued} and {key: time started}, oldest first
+        self.pending = collections.OrderedDict()
+        self.active = collections.OrderedDict()
+        self.logger = logging.getLogger("SS2AdmissionScheduler")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.burst_start = None
+        self.burst_count = 0
+        # (number of datapaths, seconds until all were done)
+        self.last_burst = None
+
+    def add(self, key):
+        "Queue a datapath, returns the list of keys to start programming"
+
+        self.pending.pop(key, None)
+        self.active.pop(key, None)
+        if self.burst_start == None:
+            self.burst_start = time.time()
+            self.burst_count = 0
+        self.pending[key] = time.time()
+        return self._start()
+
+    def _start(self):
+        "Move pending keys to active while there is room"
+
+        started = []
+        while self.pending and len(self.active) < self.concurrency:
+            key, _ = self.pending.popitem(last=False)
+            self.active[key] = time.time()
+            started.append(key)
+        return started
+
+    def _check_burst(self):
+        "Record the end of a burst once nothing is pending or active"
+
+        if self.burst_start == None or self.is_busy():
+            return
+        self.last_burst = (self.burst_count, time.time() - self.burst_start)
+        self.burst_start = None
+        self.logger.info("%d datapaths ready in %.3fs", *self.last_burst)
+
+    def done(self, key):
+        "Mark an active key as done, returns the list of keys to start"
+
+        if self.active.pop(key, None) == None:
+            return []
+        self.burst_count += 1
+        started = self._start()
+        self._check_burst()
+        return started
+
+    def remove(self, key):
+        "Forget a key that disconnected, returns the list of keys to start"
+
+        self.pending.pop(key, None)
+        self.active.pop(key, None)
+        started = self._start()
+        self._check_burst()
+        return started
+
+    def expire(self):
+        """Mark keys active for longer than timeout as done
+
+        Returns a tuple of the expired keys and the keys to start.
+        """
+
+        curtime = time.time()
+        expired = [key for key, started in self.active.items()
+                   if started + self.timeout < curtime]
+        started = []
+        for key in expired:
+            self.logger.warning("%s not ready after %ss", key, self.timeout)
+            started += self.done(key)
+        return expired, started
+
+    def is_busy(self):
+        "Check if any datapath is still pending or being programmed"
+
+        return bool(self.pending or self.active)
+
+    def is_admitted(self, key):
+        "Check if a datapath is done, or was never queued"
+
+        return key not in self.pending and key not in self.active
@@ -23,25 +23,46 @@
 Base Application Class for SimpleSwitch 2.0 Apps
 """
 
-from . import config, util
+from . import config
+from .delivery import DeliveryQueue
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import HANDSHAKE_DISPATCHER
 from ryu.controller.handler import set_ev_cls
+from ryu.lib import hub
 from ryu.lib.packet import ethernet, ether_types as ether, packet
 from ryu.ofproto import ofproto_v1_3
 
+# Match the full cookie of a flow
+COOKIE_MASK = 0xffffffffffffffff
+# The app's cookie is in the lower bits of the cookie of its flows. The upper
+# bits are free for the app to tell its own flows apart.
+APP_COOKIE_MASK = 0xffffffff
+
 class SS2App(object):
     "Base methods for SS2 RyuApp classes"
 
-    ## Static Helper Methods
+    ## Event Handlers
 
-    @staticmethod
-    def send_msgs(dp, msgs):
-        "Send all the messages provided to the datapath"
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def barrier_reply_handler(self, ev):
+        "Confirm messages sent through the delivery queue"
+
+        queue = self.delivery_queues().get(ev.msg.datapath.id, None)
+        if queue != None and queue.dp is ev.msg.datapath:
+            queue.barrier_reply(ev.msg.xid)
 
-        for msg in msgs:
-            dp.send_msg(msg)
+    @set_ev_cls(ofp_event.EventOFPErrorMsg,
+                [HANDSHAKE_DISPATCHER, CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def error_msg_handler(self, ev):
+        "Match errors to the messages sent through the delivery queue"
+
+        queue = self.delivery_queues().get(ev.msg.datapath.id, None)
+        if queue != None and queue.dp is ev.msg.datapath:
+            queue.error(ev.msg.xid, ev.msg)
+
+    ## Static Helper Methods
 
     @staticmethod
     def apply_actions(dp, actions):
@@ -60,6 +81,34 @@ class SS2App(object):
 
         return dp.ofproto_parser.OFPActionOutput(**kwargs)
 
+    @staticmethod
+    def action_group(dp, group_id):
+        "Generate an OFPActionGroup message"
+
+        return dp.ofproto_parser.OFPActionGroup(group_id)
+
+    @staticmethod
+    def action_push_vlan(dp, vid):
+        "Generate the actions tagging a packet with VLAN vid"
+
+        parser = dp.ofproto_parser
+        return [parser.OFPActionPushVlan(ether.ETH_TYPE_8021Q),
+                parser.OFPActionSetField(
+                    vlan_vid=vid | dp.ofproto.OFPVID_PRESENT)]
+
+    @staticmethod
+    def action_pop_vlan(dp):
+        "Generate an OFPActionPopVlan message"
+
+        return dp.ofproto_parser.OFPActionPopVlan()
+
+    @staticmethod
+    def write_metadata(dp, metadata, metadata_mask):
+        "Generate an OFPInstructionWriteMetadata message"
+
+        return dp.ofproto_parser.OFPInstructionWriteMetadata(metadata,
+                                                             metadata_mask)
+
     @staticmethod
     def goto_table(dp, table_id):
         "Generate an OFPInstructionGotoTable message"
@@ -81,6 +130,36 @@ class SS2App(object):
             kwargs['eth_type'] = eth_type
         return dp.ofproto_parser.OFPMatch(**kwargs)
 
+    @staticmethod
+    def group_mod(dp, group_id, command=None, group_type=None, buckets=None):
+        "Generate an OFPGroupMod message, adding an OFPGT_ALL group by default"
+
+        ofp = dp.ofproto
+        if command == None:
+            command = ofp.OFPGC_ADD
+        if group_type == None:
+            group_type = ofp.OFPGT_ALL
+
+        return dp.ofproto_parser.OFPGroupMod(dp, command, group_type, group_id,
+                                             buckets or [])
+
+    @staticmethod
+    def bucket(dp, actions):
+        "Generate an OFPBucket message for an OFPGT_ALL group"
+
+        return dp.ofproto_parser.OFPBucket(actions=actions)
+
+    @staticmethod
+    def packet_out(dp, actions, data, in_port=None):
+        "Generate an unbuffered OFPPacketOut message for the data provided"
+
+        if in_port == None:
+            in_port = dp.ofproto.OFPP_CONTROLLER
+
+        return dp.ofproto_parser.OFPPacketOut(
+            datapath=dp, buffer_id=dp.ofproto.OFP_NO_BUFFER, in_port=in_port,
+            actions=actions, data=data)
+
     @staticmethod
     def barrier_request(dp):
         """Generate an OFPBarrierRequest message
@@ -96,6 +175,64 @@ class SS2App(object):
 
     ## Instance Helper Methods
 
+    def delivery_queues(self):
+        "Returns the {dpid: DeliveryQueue} of the app, creating it if needed"
+
+        if not hasattr(self, '_delivery_queues'):
+            self._delivery_queues = {}
+        return self._delivery_queues
+
+    def delivery_loop(self):
+        """Periodically fail the batches without a barrier reply in time
+
+        Batches are otherwise only expired when more messages are sent to
+        the datapath.
+        """
+
+        while True:
+            hub.sleep(self.config.delivery_timeout)
+            for queue in list(self.delivery_queues().values()):
+                queue.expire()
+
+    def send_msgs(self, dp, msgs, context=None, on_error=None):
+        """Send all the messages provided to the datapath
+
+        With pipelined_delivery enabled, the messages go through the delivery
+        queue of the datapath and on_error(dp, context, msg, error) is called
+        if they fail. Otherwise they are sent straight away.
+        """
+
+        if not self.config.pipelined_delivery:
+            for msg in msgs:
+                dp.send_msg(msg)
+            return True
+
+        queues = self.delivery_queues()
+        queue = queues.get(dp.id, None)
+        if queue == None or queue.dp is not dp:
+            queue = DeliveryQueue(dp, self.barrier_request,
+                                  self.config.delivery_window,
+                                  self.config.delivery_queue_limit,
+                                  self.config.delivery_timeout)
+            queues[dp.id] = queue
+            if not hasattr(self, '_delivery_thread'):
+                self._delivery_thread = hub.spawn(self.delivery_loop)
+
+        def _on_error(context, msg, error):
+            "Report failures to on_error, or log them"
+            if on_error != None:
+                on_error(dp, context, msg, error)
+            elif error != None:
+                self.logger.warning("Error %s/%s from %s for %s", error.type,
+                                    error.code, dp.id, msg)
+
+        return queue.send(msgs, context, _on_error)
+
+    def is_own_flow(self, msg):
+        "Check if a packet-in or flow-removed message is for an app's own flow"
+
+        return msg.cookie & APP_COOKIE_MASK == self.config.cookie
+
     def all_ss2_tables(self):
         "Returns a list of all tables referenced in the current app's config"
         tables = []
@@ -108,14 +245,18 @@ class SS2App(object):
     def flowmod(self, dp, table_id, command=None, idle_timeout=None,
                 hard_timeout=None, priority=None, buffer_id=None,
                 out_port=None, out_group=None, flags=None, match=None,
-                instructions=None):
-        "Generate an OFPFlowMod message with the cookie already specified"
+                instructions=None, cookie_mask=None, cookie=None):
+        """Generate an OFPFlowMod message with the cookie already specified
+
+        cookie defaults to the app's cookie. A different cookie must keep the
+        app's cookie in the bits of APP_COOKIE_MASK.
+        """
 
         mod_kwargs = {
             'datapath': dp,
             'table_id': table_id,
             'command': command or dp.ofproto.OFPFC_ADD,
-            'cookie': self.config.cookie
+            'cookie': self.config.cookie if cookie == None else cookie
         }
         # Selectively add kwargs so ofproto defaults will be used otherwise.
         # Not using **kwargs in method defintion so arguments can be easy to
@@ -138,17 +279,26 @@ class SS2App(object):
             mod_kwargs['match'] = match
         if instructions != None:
             mod_kwargs['instructions'] = instructions
+        if cookie_mask != None:
+            mod_kwargs['cookie_mask'] = cookie_mask
         return dp.ofproto_parser.OFPFlowMod(**mod_kwargs)
 
     def flowdel(self, dp, table_id, priority=None, match=None, out_port=None):
-        "Generate an OFPFlowMod through flowmod with the OFPFC_DELETE command"
+        """Generate an OFPFlowMod through flowmod with the OFPFC_DELETE command
+
+        Only flows with the app's cookie are deleted, so apps sharing a table
+        do not remove each other's flows. The upper bits of the cookie are
+        ignored, so this includes flows with any cookie the app derived from
+        its own.
+        """
 
         return self.flowmod(dp, table_id,
                             priority=priority,
                             match=match,
                             command=dp.ofproto.OFPFC_DELETE,
                             out_port=out_port or dp.ofproto.OFPP_ANY,
-                            out_group=dp.ofproto.OFPG_ANY)
+                            out_group=dp.ofproto.OFPG_ANY,
+                            cookie_mask=APP_COOKIE_MASK)
 
     def clean_all_flows(self, dp):
         "Remove all flows with the SS2 cookie from all tables"
@@ -23,7 +23,8 @@
 SimpleSwitch 2.0 (SS2) Configuration Loader
 
 Will first load `defaults.cfg` relative in the `ss2` package, then load
-`ss2.cfg` in the current working directory by default.
+`ss2.cfg` in the current working directory by default, followed by any files
+listed in the `SS2_CONFIG` environment variable (separated by `os.pathsep`).
 """
 
 import os
@@ -34,6 +35,7 @@ except ImportError:
 
 DEFAULT_CONFIG = os.path.join(os.path.dirname(__file__), 'defaults.cfg')
 DEFAULT_FILES = ['ss2.cfg']
+ENV_FILES = 'SS2_CONFIG'
 
 class AttrDict(dict):
     "An object that allows attrDict.foo or attrDict['foo']"
@@ -46,7 +48,9 @@ class AttrDict(dict):
 
 def get_parser(files=None):
     "Read config files for SS2"
-    files = files or DEFAULT_FILES
+    if not files:
+        files = DEFAULT_FILES + [f for f in os.environ.get(ENV_FILES, '')
+                                 .split(os.pathsep) if f]
 
     parser = ConfigParser()
     parser.readfp(open(DEFAULT_CONFIG))
@@ -25,16 +25,30 @@ SimpleSwitch 2.0 (SS2) Core Controller Application
 TODO: Diagram the table structure used here
 """
 
-from . import config, util
-from .app import SS2App
+import time
+from . import config, shard, util
+from .admission import AdmissionScheduler
+from .app import COOKIE_MASK, SS2App
+from .discovery import LinkDiscovery
+from .flaps import FlapDamper
+from .proxy import AddressProxy
+from .stats import HostActivity
+from .topology import Topology, parse_links
+from .vlan import VlanMap, parse_vlan_ports
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
-from ryu.lib.packet import ethernet, ether_types as ether, packet
+from ryu.lib import hub
+from ryu.lib.packet import arp, ethernet, ether_types as ether, icmpv6
+from ryu.lib.packet import in_proto, packet
 from ryu.ofproto import ofproto_v1_3
 
-class SS2Core(app_manager.RyuApp, SS2App):
+# Bits of the OpenFlow metadata carrying the VLAN with VLAN aware learning
+VLAN_METADATA_MASK = 0xfff
+
+class SS2Core(app_manager.RyuApp, SS2App, AddressProxy, LinkDiscovery):
     "SS2 RyuApp"
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
@@ -42,6 +56,64 @@ class SS2Core(app_manager.RyuApp, SS2App):
         super(SS2Core, self).__init__(*args, **kwargs)
         self.config = config.read_config()
         self.host_cache = util.HostCache(self.config.host_cache_timeout)
+        # Connected datapaths by dpid, and their ports as {port_no: hw_addr}
+        self.datapaths = {}
+        self.ports = {}
+        # Where hosts were learned by (MAC, VLAN), as {(dpid, port): entry}.
+        # The most recent one at an edge port is used for proactive
+        # distribution.
+        self.hosts = {}
+        self.topology = Topology(self.config.lldp_interval *
+                                 self.config.lldp_miss_count)
+
+        if self.config.topology_mode == "static":
+            for link in parse_links(self.config.topology_links):
+                self.topology.add_link(*link, static=True)
+        elif self.config.topology_mode == "lldp":
+            self.lldp_thread = hub.spawn(self.lldp_loop)
+        self.flaps = FlapDamper(self.config.flap_penalty,
+                                self.config.flap_suppress,
+                                self.config.flap_reuse,
+                                self.config.flap_half_life,
+                                self.config.flap_max_penalty)
+        # Hosts with flows on each datapath and the number of hosts that fit
+        # in the datapath's tables
+        self.learned = util.LearnedHosts(self.config.learn_timeout)
+        self.host_limits = {}
+        self.activity = HostActivity(self.config.learn_timeout_min,
+                                     self.config.learn_timeout_max,
+                                     self.config.learn_busy_rate)
+        # Table and poll of the flow stats replies still in progress, by
+        # datapath and request xid. A poll holds the packet counts of every
+        # table requested together, as {table_id: {(mac, vid): count}}.
+        self.flow_stats = {}
+        if self.config.adaptive_learn_timeout:
+            self.stats_thread = hub.spawn(self.stats_loop)
+        self.addresses = util.AddressTable(self.config.address_proxy_timeout)
+        # Datapaths waiting to be programmed, and the barrier xids of the
+        # datapaths being programmed
+        self.admission = AdmissionScheduler(
+            self.config.admission_concurrency, self.config.admission_timeout)
+        self.admission_pending = {}
+        self.admission_xids = {}
+        if self.config.admission_control:
+            self.admission_thread = hub.spawn(self.admission_loop)
+        # Every connected datapath in sharded mode, including the ones owned
+        # by other shards
+        self.shard_datapaths = {}
+        if self.config.shard_count > 1:
+            self.shared = shard.SharedState(self.config.shard_state_file,
+                                            self.config.shard_count,
+                                            self.config.shard_host_slots,
+                                            self.config.shard_timeout)
+            self.shared.heartbeat(self.config.shard_id)
+            self.shard_thread = hub.spawn(self.shard_loop)
+        self.flood_exclude_ports = set(
+            util.parse_ports(self.config.flood_exclude_ports))
+        self.vlans = VlanMap(
+            parse_vlan_ports(self.config.vlan_access_ports),
+            parse_vlan_ports(self.config.vlan_trunk_ports),
+            self.config.vlan_native)
 
 
     ## Event Handlers
@@ -50,14 +122,154 @@ class SS2Core(app_manager.RyuApp, SS2App):
     def switch_features_handler(self, ev):
         "Handle new datapaths attaching to Ryu"
 
-        msgs = self.add_datapath(ev.msg.datapath)
+        dp = ev.msg.datapath
+        if self.config.shard_count > 1:
+            # Every worker is connected, only the owner programs it
+            self.shard_datapaths[dp.id] = dp
+            if self.shard_owner(dp.id) != self.config.shard_id:
+                self.send_msgs(dp, [self.role_request(dp, master=False)])
+                return
+            self.send_msgs(dp, [self.role_request(dp, master=True)])
+
+        self.attach_datapath(dp)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def admission_barrier_reply_handler(self, ev):
+        "Admit the next datapaths once one confirms its default flows"
+
+        dpid = ev.msg.datapath.id
+        if self.admission_xids.get(dpid, None) != ev.msg.xid:
+            return
+
+        del self.admission_xids[dpid]
+        for dpid in self.admission.done(dpid):
+            self.program_datapath(self.admission_pending.pop(dpid))
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, DEAD_DISPATCHER)
+    def state_change_handler(self, ev):
+        "Forget datapaths that disconnect from Ryu"
+
+        dpid = ev.datapath.id
+        if dpid == None:
+            return
+
+        if self.shard_datapaths.get(dpid) is ev.datapath:
+            del self.shard_datapaths[dpid]
+
+        if self.datapaths.get(dpid) is ev.datapath or \
+           self.admission_pending.get(dpid) is ev.datapath:
+            self.release_datapath(dpid)
+
+    @set_ev_cls(ofp_event.EventOFPPortDescStatsReply, MAIN_DISPATCHER)
+    def port_desc_stats_reply_handler(self, ev):
+        "Record the ports of a datapath used for link discovery"
+
+        dp = ev.msg.datapath
+        ports = self.ports.setdefault(dp.id, {})
+        for port in ev.msg.body:
+            if port.port_no <= dp.ofproto.OFPP_MAX:
+                ports[port.port_no] = port.hw_addr
+
+        if self.uses_flood_groups():
+            self.update_flood_groups([dp.id])
+
+    @set_ev_cls(ofp_event.EventOFPTableFeaturesStatsReply, MAIN_DISPATCHER)
+    def table_features_stats_reply_handler(self, ev):
+        "Limit the number of hosts to what fits in the learning tables"
+
+        dp = ev.msg.datapath
+        tables = [self.config.table_eth_src, self.config.table_eth_dst]
+        for table in ev.msg.body:
+            if table.table_id not in tables:
+                continue
+            limit = table.max_entries - self.config.host_limit_reserve
+            if self.config.host_limit:
+                limit = min(limit, self.config.host_limit)
+            limit = max(limit, 1)
+            self.host_limits[dp.id] = min(self.host_limits.get(dp.id, limit),
+                                          limit)
+            self.logger.info("Limiting %s to %d hosts", dp.id,
+                             self.host_limits[dp.id])
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def flow_stats_reply_handler(self, ev):
+        "Collect host packet counts from the stats requested by stats_loop"
+
+        dp = ev.msg.datapath
+        ofp = dp.ofproto
+        # Other apps request flow stats too, only handle replies to ours
+        pending = self.flow_stats.get((dp.id, ev.msg.xid), None)
+        if pending == None:
+            return
+
+        table_id, poll = pending
+        counts = poll[table_id]
+        field = {self.config.table_eth_src: 'eth_src',
+                 self.config.table_eth_dst: 'eth_dst'}[table_id]
+        for stats in ev.msg.body:
+            if stats.cookie != self.config.cookie or \
+               stats.table_id != table_id or \
+               stats.priority != self.config.priority_high:
+                continue
+            host = (stats.match[field], self.match_vid(stats.match))
+            counts[host] = counts.get(host, 0) + stats.packet_count
+
+        if ev.msg.flags & ofp.OFPMPF_REPLY_MORE:
+            return
+
+        del self.flow_stats[(dp.id, ev.msg.xid)]
+        # Rates are only updated once the replies of every table are in
+        for _, other in self.flow_stats.values():
+            if other is poll:
+                return
+        for mac, vid in self.activity.update(dp.id, poll):
+            self.learned.refresh(dp.id, mac, vid)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def flow_removed_handler(self, ev):
+        "Forget hosts whose eth_dst flow timed out"
+
+        msg = ev.msg
+        if not self.is_own_flow(msg) or \
+           msg.table_id != self.config.table_eth_dst or \
+           msg.reason == msg.datapath.ofproto.OFPRR_DELETE:
+            # Deletes are already accounted for when they are sent
+            return
+
+        eth_dst = msg.match.get('eth_dst', None)
+        if eth_dst != None:
+            self.learned.remove(msg.datapath.id, eth_dst,
+                                self.match_vid(msg.match))
+
+    @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
+    def port_status_handler(self, ev):
+        "Keep track of added and removed ports"
+
+        dp = ev.msg.datapath
+        ofp = dp.ofproto
+        port = ev.msg.desc
+        if port.port_no > ofp.OFPP_MAX:
+            return
+
+        ports = self.ports.setdefault(dp.id, {})
+        if ev.msg.reason == ofp.OFPPR_DELETE:
+            ports.pop(port.port_no, None)
+            if self.config.topology_mode == "lldp":
+                self.remove_link_ports(
+                    self.topology.remove_link(dp.id, port.port_no))
+        else:
+            ports[port.port_no] = port.hw_addr
 
-        self.send_msgs(ev.msg.datapath, msgs)
+        if self.uses_flood_groups():
+            self.update_flood_groups([dp.id])
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):
         "Handle incoming packets from a datapath"
 
+        if not self.is_own_flow(ev.msg):
+            return
+
         dp = ev.msg.datapath
         in_port = ev.msg.match['in_port']
 
@@ -65,42 +277,503 @@ class SS2Core(app_manager.RyuApp, SS2App):
         pkt = packet.Packet(ev.msg.data)
         eth = pkt.get_protocols(ethernet.ethernet)[0]
 
+        if eth.ethertype == ether.ETH_TYPE_LLDP:
+            self.handle_lldp(dp, in_port, pkt)
+            return
+
+        # ARP requests and neighbor solicitations punted by the proxy flows
+        if ev.msg.table_id == self.config.table_l2_switch:
+            self.handle_address_request(dp, in_port, pkt)
+            return
+
+        # Programming new datapaths goes before learning during a burst of
+        # connects
+        if self.config.admission_control and \
+           (not self.admission.is_admitted(dp.id) or
+            (self.config.admission_defer_learning and
+             self.admission.is_busy())):
+            return
+
+        # Hosts are only learned at the edge. Other datapaths get their flows
+        # for the host through distribute_host.
+        if self.topology.is_link_port(dp.id, in_port):
+            return
+
+        # With VLAN aware learning, the VLAN assigned in table_l2_switch
+        # arrives in the metadata
+        vid = self.match_vid(ev.msg.match)
+        if self.config.vlan_mode and vid == None:
+            return
+
         # Ensure this host was not recently learned to avoid flooding the switch
         # with the learning messages if the learning was already in process.
-        if not self.host_cache.is_new_host(dp.id, in_port, eth.src):
+        if not self.host_cache.is_new_host(dp.id, in_port, eth.src, vid):
+            return
+
+        # Hosts moving between ports too often stay where they were until
+        # their flap penalty decays
+        if self.config.flap_damping and \
+           not self.flaps.learn(dp.id, in_port, eth.src, vid):
+            self.send_msgs(dp, self.add_damped_flow(dp, eth.src, vid))
             return
 
         msgs = self.learn_source(
             dp=dp,
             port=in_port,
-            eth_src=eth.src)
-
-        self.send_msgs(dp, msgs)
+            eth_src=eth.src,
+            vid=vid)
+
+        self.send_msgs(dp, msgs, context=(in_port, eth.src, vid),
+                       on_error=self.learn_failed)
+
+        if self.config.shard_count > 1:
+            previous = self.shared.learn(eth.src, self.config.shard_id,
+                                         dp.id, in_port)
+            if previous != None and previous.shard != self.config.shard_id:
+                self.logger.info("%s moved from %s, %s on shard %s to %s, %s",
+                                 eth.src, previous.dpid, previous.port,
+                                 previous.shard, dp.id, in_port)
+
+        if self.config.topology_mode != "none":
+            # Before its links are discovered, a datapath also learns hosts
+            # on its links. Keeping every location lets the edge one take
+            # over again once those are known to be link ports.
+            host = util.HostEntry(dp.id, in_port, eth.src, vid)
+            self.hosts.setdefault((eth.src, vid), {})[(dp.id, in_port)] = host
+            self.distribute_host(host)
 
     ## Instance Helper Methods
 
+    def attach_datapath(self, dp):
+        "Program a datapath now, or once admission control lets it through"
+
+        if not self.config.admission_control:
+            self.program_datapath(dp)
+            return
+
+        self.admission_pending[dp.id] = dp
+        for dpid in self.admission.add(dp.id):
+            self.program_datapath(self.admission_pending.pop(dpid))
+
+    def shard_owner(self, dpid):
+        "Returns the shard owning dpid among the shards that are alive"
+
+        alive = self.shared.alive_shards()
+        if self.config.shard_id not in alive:
+            alive.append(self.config.shard_id)
+        return shard.SharedState.owner(dpid, alive)
+
+    def role_request(self, dp, master):
+        "Generate an OFPRoleRequest for the master or slave role"
+
+        ofp = dp.ofproto
+        role = ofp.OFPCR_ROLE_MASTER if master else ofp.OFPCR_ROLE_SLAVE
+        return dp.ofproto_parser.OFPRoleRequest(dp, role,
+                                                self.shared.next_generation())
+
+    def shard_loop(self):
+        "Periodically mark this shard alive and rebalance datapaths"
+
+        while True:
+            self.shared.heartbeat(self.config.shard_id)
+            self.rebalance_shards()
+            hub.sleep(self.config.shard_heartbeat_interval)
+
+    def rebalance_shards(self):
+        """Take over or hand over datapaths as shards stop or come back
+
+        Takes over datapaths whose owner stopped sending heartbeats, and hands
+        back datapaths to a shard that came back.
+        """
+
+        for dpid, dp in list(self.shard_datapaths.items()):
+            owned = dpid in self.datapaths or dpid in self.admission_pending
+            if self.shard_owner(dpid) == self.config.shard_id:
+                if not owned:
+                    self.logger.info("Taking over %s", dpid)
+                    self.send_msgs(dp, [self.role_request(dp, True)])
+                    self.attach_datapath(dp)
+            elif owned:
+                self.logger.info("Handing over %s", dpid)
+                self.release_datapath(dpid)
+                self.send_msgs(dp, [self.role_request(dp, False)])
+
+    def program_datapath(self, dp):
+        """Send the default flows to a datapath and start using it
+
+        With admission control, a tracked barrier request follows so the
+        datapath is admitted once the switch processed everything before it.
+        """
+
+        self.datapaths[dp.id] = dp
+        self.send_msgs(dp, self.add_datapath(dp))
+
+        if self.topology.link_ports(dp.id):
+            self.distribute_hosts()
+
+        if self.config.admission_control:
+            barrier = self.barrier_request(dp)
+            self.admission_xids[dp.id] = dp.set_xid(barrier)
+            self.send_msgs(dp, [barrier])
+
+    def release_datapath(self, dpid):
+        "Stop using a datapath and forget everything learned about it"
+
+        if self.config.admission_control:
+            self.admission_pending.pop(dpid, None)
+            self.admission_xids.pop(dpid, None)
+            for next_dpid in self.admission.remove(dpid):
+                self.program_datapath(self.admission_pending.pop(next_dpid))
+
+        if self.datapaths.pop(dpid, None) == None:
+            return
+
+        self.ports.pop(dpid, None)
+        if self.config.topology_mode == "lldp":
+            self.remove_link_ports(self.topology.remove_datapath(dpid))
+        self.forget_hosts(dpid)
+        self.addresses.remove_datapath(dpid)
+        self.learned.remove_datapath(dpid)
+        self.host_limits.pop(dpid, None)
+        self.activity.remove_datapath(dpid)
+        for key in list(self.flow_stats.keys()):
+            if key[0] == dpid:
+                del self.flow_stats[key]
+
+    def admission_loop(self):
+        "Periodically admit datapaths that did not confirm their programming"
+
+        while True:
+            expired, started = self.admission.expire()
+            for dpid in expired:
+                self.admission_xids.pop(dpid, None)
+            for dpid in started:
+                self.program_datapath(self.admission_pending.pop(dpid))
+            hub.sleep(1)
+
     def add_datapath(self, dp):
         "Add the specified datapath to our app by adding default rules"
 
         msgs = self.clean_all_flows(dp)
+        if self.config.vlan_mode:
+            msgs += self.add_vlan_flood_groups(dp)
+        elif self.config.flood_groups:
+            msgs += self.add_flood_group(dp)
         msgs += self.add_default_flows(dp)
+        for port in self.topology.link_ports(dp.id):
+            msgs += self.add_link_port_flow(dp, port)
+        if self.config.topology_mode == "lldp" or self.uses_flood_groups():
+            msgs += [dp.ofproto_parser.OFPPortDescStatsRequest(dp, 0)]
+        if self.config.host_eviction:
+            msgs += [dp.ofproto_parser.OFPTableFeaturesStatsRequest(dp, 0, [])]
         return msgs
 
-    def learn_source(self, dp, port, eth_src):
-        "Learn the port associated with the source MAC"
+    def add_flood_group(self, dp):
+        """Replace the flood group with one that floods to all ports
+
+        The group is updated with the actual flood ports by update_flood_groups
+        once the ports of the datapath are known. Until then it behaves like
+        OFPP_FLOOD so the flows pointing at it are valid straight away.
+        """
+
+        ofp = dp.ofproto
+        group_id = self.config.flood_group_id
+        buckets = [self.bucket(dp, [self.action_output(dp, ofp.OFPP_FLOOD)])]
+        return [self.group_mod(dp, group_id, command=ofp.OFPGC_DELETE),
+                self.barrier_request(dp),
+                self.group_mod(dp, group_id, buckets=buckets)]
+
+    def add_vlan_flood_groups(self, dp):
+        """Replace the flood group of every VLAN on the datapath
+
+        Until the ports of the datapath are known, the groups only flood to
+        the access and trunk ports configured for the datapath.
+        """
 
-        msgs = self.unlearn_source(dp, eth_src=eth_src)
-        msgs += self.add_eth_src_flow(dp, in_port=port, eth_src=eth_src)
-        msgs += self.add_eth_dst_flow(dp, out_port=port, eth_dst=eth_src)
+        ofp = dp.ofproto
+        ports = set(port for port, _vid in self.vlans.access_ports(dp.id))
+        ports.update(port for port, _vids in self.vlans.trunk_ports(dp.id))
+        ports = [port for port in sorted(ports)
+                 if (dp.id, port) not in self.flood_exclude_ports]
+        msgs = []
+        for vid in self.vlans.vlans(dp.id):
+            group_id = self.config.flood_group_id + vid
+            buckets = [self.bucket(dp, self.output_actions(dp, port, vid))
+                       for port in self.vlans.members(dp.id, vid, ports)]
+            msgs += [self.group_mod(dp, group_id, command=ofp.OFPGC_DELETE),
+                     self.barrier_request(dp),
+                     self.group_mod(dp, group_id, buckets=buckets)]
+        return msgs
+
+    def uses_flood_groups(self):
+        "Check if datapaths flood through groups kept up to date with ports"
+
+        return self.config.flood_groups or self.config.vlan_mode
+
+    def flood_ports(self, dpid, tree):
+        """Ports on dpid that are part of the flood domain
+
+        Excludes configured ports and links that are not part of the spanning
+        tree so broadcasts can not loop between datapaths.
+        """
+
+        ports = []
+        for port in sorted(self.ports.get(dpid, {})):
+            if (dpid, port) in self.flood_exclude_ports:
+                continue
+            if self.topology.is_link_port(dpid, port) and \
+               (dpid, port) not in tree:
+                continue
+            ports.append(port)
+        return ports
+
+    def update_flood_groups(self, dpids=None):
+        """Update the flood group of datapaths with their current flood ports
+
+        With VLAN aware learning, the flood group of each VLAN is updated with
+        the flood ports carrying the VLAN.
+        """
+
+        tree = self.topology.spanning_tree()
+        for dpid in dpids or list(self.datapaths.keys()):
+            dp = self.datapaths.get(dpid, None)
+            if dp == None or not self.ports.get(dpid, None):
+                continue
+            ofp = dp.ofproto
+            ports = self.flood_ports(dpid, tree)
+            if not self.config.vlan_mode:
+                buckets = [self.bucket(dp, [self.action_output(dp, port)])
+                           for port in ports]
+                self.send_msgs(dp, [self.group_mod(
+                    dp, self.config.flood_group_id,
+                    command=ofp.OFPGC_MODIFY, buckets=buckets)])
+                continue
+
+            msgs = []
+            for vid in self.vlans.vlans(dpid):
+                buckets = [self.bucket(dp, self.output_actions(dp, port, vid))
+                           for port in self.vlans.members(dpid, vid, ports)]
+                msgs += [self.group_mod(dp, self.config.flood_group_id + vid,
+                                        command=ofp.OFPGC_MODIFY,
+                                        buckets=buckets)]
+            self.send_msgs(dp, msgs)
+
+    def flood_actions(self, dp, vid=None):
+        """Actions to flood a packet, either with OFPP_FLOOD or the flood group
+
+        With VLAN aware learning, packets are flooded through the group of
+        their VLAN.
+        """
+
+        if vid != None:
+            return [self.action_group(dp, self.config.flood_group_id + vid)]
+        if self.config.flood_groups:
+            return [self.action_group(dp, self.config.flood_group_id)]
+        return [self.action_output(dp, dp.ofproto.OFPP_FLOOD)]
+
+    def output_actions(self, dp, port, vid=None):
+        "Actions to output a packet of VLAN vid to port, tagged on trunk ports"
+
+        actions = []
+        if vid != None and self.vlans.is_trunk(dp.id, port):
+            actions += self.action_push_vlan(dp, vid)
+        return actions + [self.action_output(dp, port)]
+
+    def match_vid(self, match):
+        """Returns the VLAN of a packet-in or host flow from its metadata
+
+        Returns None without VLAN aware learning, or if the packet was not
+        assigned a VLAN.
+        """
+
+        if not self.config.vlan_mode:
+            return None
+        metadata = match.get('metadata', None)
+        if isinstance(metadata, tuple):
+            # Masked match of a flow
+            metadata = metadata[0]
+        return (metadata or 0) & VLAN_METADATA_MASK or None
+
+    def host_match(self, dp, vid, **kwargs):
+        "Generate an OFPMatch for a host flow, limited to vid if it is set"
+
+        if vid != None:
+            kwargs['metadata'] = (vid, VLAN_METADATA_MASK)
+        return self.match(dp, **kwargs)
+
+    def distribute_host(self, host):
+        "Install flows toward an edge host on all other datapaths"
+
+        for dpid, out_port in self.topology.next_hops(host.dpid).items():
+            dp = self.datapaths.get(dpid, None)
+            if dp == None:
+                continue
+            msgs = self.admit_host(dp, out_port, host.mac, host.vid)
+            msgs += self.unlearn_source(dp, eth_src=host.mac, vid=host.vid)
+            msgs += self.add_eth_dst_flow(dp, out_port=out_port,
+                                          eth_dst=host.mac, vid=host.vid)
+            self.send_msgs(dp, msgs)
+
+    def edge_host(self, key):
+        "Returns the most recent location of a host that is not a link port"
+
+        edge = [host for host in self.hosts.get(key, {}).values()
+                if not self.topology.is_link_port(host.dpid, host.port)]
+        if not edge:
+            return None
+        return max(edge, key=lambda host: host.timestamp)
+
+    def distribute_hosts(self):
+        """Distribute all hosts whose flows at their edge have not timed out
+
+        The learned entry of the host on its own datapath has the timeout of
+        the flows installed for it, and stats activity keeps it fresh.
+        """
+
+        curtime = time.time()
+        for key, locations in list(self.hosts.items()):
+            for location, host in list(locations.items()):
+                installed = self.learned.get(host.dpid, host.mac, host.vid)
+                if installed == None or installed.port != host.port or \
+                   installed.timestamp + installed.timeout < curtime:
+                    del locations[location]
+            if not locations:
+                del self.hosts[key]
+                continue
+            host = self.edge_host(key)
+            if host != None:
+                self.distribute_host(host)
+
+    def forget_hosts(self, dpid, port=None):
+        "Forget the locations of hosts on dpid, or only on one of its ports"
+
+        for key, locations in list(self.hosts.items()):
+            for location in list(locations.keys()):
+                if location[0] == dpid and port in [None, location[1]]:
+                    del locations[location]
+            if not locations:
+                del self.hosts[key]
+
+    def stats_loop(self):
+        """Periodically request the host flow stats of every datapath
+
+        Uses one flow stats request per learning table, filtered by our
+        cookie, rather than one request per host.
+        """
+
+        while True:
+            for dp in list(self.datapaths.values()):
+                self.send_msgs(dp, self.host_stats_requests(dp))
+            hub.sleep(self.config.learn_stats_interval)
+
+    def host_stats_requests(self, dp):
+        "Generate the flow stats requests for the eth_src and eth_dst tables"
+
+        ofp = dp.ofproto
+        msgs = []
+        poll = {}
+        for table_id in [self.config.table_eth_src, self.config.table_eth_dst]:
+            msg = dp.ofproto_parser.OFPFlowStatsRequest(
+                dp, 0, table_id, ofp.OFPP_ANY, ofp.OFPG_ANY,
+                self.config.cookie, COOKIE_MASK, self.match(dp))
+            poll[table_id] = {}
+            self.flow_stats[(dp.id, dp.set_xid(msg))] = (table_id, poll)
+            msgs += [msg]
+        return msgs
+
+    def learn_timeout(self, dp, mac, vid=None):
+        "Learn timeout for a host, adapted to its traffic when enabled"
+
+        if not self.config.adaptive_learn_timeout:
+            return self.config.learn_timeout
+        return self.activity.timeout(dp.id, (mac, vid),
+                                     self.config.learn_timeout)
+
+    def learn_source(self, dp, port, eth_src, vid=None):
+        "Learn the port associated with the source MAC in VLAN vid"
+
+        msgs = self.admit_host(dp, port, eth_src, vid)
+        msgs += self.unlearn_source(dp, eth_src=eth_src, vid=vid)
+        msgs += self.add_eth_src_flow(dp, in_port=port, eth_src=eth_src,
+                                      vid=vid)
+        msgs += self.add_eth_dst_flow(dp, out_port=port, eth_dst=eth_src,
+                                      vid=vid)
         return msgs
 
-    def unlearn_source(self, dp, eth_src):
-        "Remove any existing flow entries for this MAC address"
+    def learn_failed(self, dp, context, _msg, error):
+        """Handle learning messages that failed or were never confirmed
+
+        Forgets the host so the next packet from it is learned again. A full
+        table lowers the host limit of the datapath to what it holds now, so
+        the retry evicts a less active host first.
+        """
+
+        port, mac, vid = context
+        if error == None:
+            self.logger.warning("Learning %s, %s, %s, %s was not confirmed",
+                                dp.id, port, mac, vid)
+        else:
+            self.logger.warning("Learning %s, %s, %s, %s failed with %s/%s",
+                                dp.id, port, mac, vid, error.type, error.code)
+
+        ofp = dp.ofproto
+        if error != None and self.config.host_eviction and \
+           error.type == ofp.OFPET_FLOW_MOD_FAILED and \
+           error.code == ofp.OFPFMFC_TABLE_FULL:
+            self.host_limits[dp.id] = max(self.learned.count(dp.id) - 1, 1)
+            self.logger.info("Limiting %s to %d hosts", dp.id,
+                             self.host_limits[dp.id])
+
+        self.learned.remove(dp.id, mac, vid)
+        self.host_cache.forget(dp.id, port, mac, vid)
+
+    def admit_host(self, dp, port, mac, vid=None):
+        """Track the host and make room for it in the datapath's tables
+
+        With host_eviction enabled, the least recently active hosts are
+        unlearned once the datapath is at its host limit. The host expires
+        with the learn timeout of the flows installed for it. Returns the
+        messages unlearning the evicted hosts.
+        """
+
+        self.learned.clean_entries(dp.id)
+        limit = self.host_limits.get(dp.id, None)
+        msgs = []
+        if self.config.host_eviction and limit and \
+           self.learned.get(dp.id, mac, vid) == None:
+            for host in self.learned.evict(dp.id, limit):
+                self.logger.info("Evicting %s, %s, %s to make room for %s",
+                                 dp.id, host.port, host.mac, mac)
+                msgs += self.unlearn_source(dp, eth_src=host.mac,
+                                            vid=host.vid)
+
+        self.learned.touch(dp.id, port, mac, vid,
+                           timeout=self.learn_timeout(dp, mac, vid))
+        return msgs
+
+    def unlearn_port(self, dp, port):
+        """Forget all hosts learned on a port that turned out to be a link
+
+        Returns the messages removing their flows. Hosts that are still
+        reachable through the port get their flows back from
+        distribute_hosts.
+        """
+
+        self.forget_hosts(dp.id, port)
+        msgs = []
+        for host in list(self.learned.iterate(dpid=dp.id, port=port)):
+            self.learned.remove(dp.id, host.mac, host.vid)
+            self.host_cache.forget(dp.id, port, host.mac, host.vid)
+            msgs += self.unlearn_source(dp, eth_src=host.mac, vid=host.vid)
+        return msgs
+
+    def unlearn_source(self, dp, eth_src, vid=None):
+        "Remove any existing flow entries for this MAC address in VLAN vid"
 
         msgs = [self.flowdel(dp, self.config.table_eth_src,
-                             match=self.match(dp, eth_src=eth_src))]
+                             match=self.host_match(dp, vid, eth_src=eth_src))]
         msgs += [self.flowdel(dp, self.config.table_eth_dst,
-                              match=self.match(dp, eth_dst=eth_src))]
+                              match=self.host_match(dp, vid, eth_dst=eth_src))]
         msgs += [self.barrier_request(dp)]
         return msgs
 
@@ -129,8 +802,33 @@ class SS2Core(app_manager.RyuApp, SS2App):
                                  match=match, priority=self.config.priority_max,
                                  instructions=[])]
 
-        # Drop LLDP
-        msgs += _drop(self.match(dp, eth_type=ether.ETH_TYPE_LLDP))
+        # Drop LLDP, unless it is used for link discovery
+        if self.config.topology_mode == "lldp":
+            actions = [self.action_output(dp, ofp.OFPP_CONTROLLER)]
+            instructions = [self.apply_actions(dp, actions)]
+            msgs += [self.flowmod(dp, self.config.table_l2_switch,
+                                  match=self.match(
+                                      dp, eth_type=ether.ETH_TYPE_LLDP),
+                                  priority=self.config.priority_max,
+                                  instructions=instructions)]
+        else:
+            msgs += _drop(self.match(dp, eth_type=ether.ETH_TYPE_LLDP))
+
+        # Send ARP requests and neighbor solicitations to the controller only,
+        # the proxy answers for known hosts and floods the rest
+        if self.config.address_proxy:
+            actions = [self.action_output(dp, ofp.OFPP_CONTROLLER,
+                                          max_len=ofp.OFPCML_NO_BUFFER)]
+            instructions = [self.apply_actions(dp, actions)]
+            for match in [self.match(dp, eth_type=ether.ETH_TYPE_ARP,
+                                     arp_op=arp.ARP_REQUEST),
+                          self.match(dp, eth_type=ether.ETH_TYPE_IPV6,
+                                     ip_proto=in_proto.IPPROTO_ICMPV6,
+                                     icmpv6_type=icmpv6.ND_NEIGHBOR_SOLICIT)]:
+                msgs += [self.flowmod(dp, self.config.table_l2_switch,
+                                      match=match,
+                                      priority=self.config.priority_high,
+                                      instructions=instructions)]
 
         # Drop STDP BPDU
         msgs += _drop(self.match(dp, eth_dst='01:80:c2:00:00:00'))
@@ -140,12 +838,14 @@ class SS2Core(app_manager.RyuApp, SS2App):
         msgs += _drop(self.match(dp, eth_src='ff:ff:ff:ff:ff:ff'))
 
         # All other packets go to table TABLE_ETH_SRC
-        match = self.match(dp)
-        instructions = [self.goto_table(dp, self.config.table_eth_src)]
-        msgs += [self.flowmod(dp, self.config.table_l2_switch,
-                              match=match,
-                              priority=self.config.priority_min,
-                              instructions=instructions)]
+        if self.config.vlan_mode:
+            msgs += self.add_vlan_flows(dp)
+        else:
+            instructions = [self.goto_table(dp, self.config.table_eth_src)]
+            msgs += [self.flowmod(dp, self.config.table_l2_switch,
+                                  match=self.match(dp),
+                                  priority=self.config.priority_min,
+                                  instructions=instructions)]
 
         ## TABLE_ETH_SRC
         # Table-miss sends to controller and sends to TABLE_ETH_DST
@@ -156,11 +856,24 @@ class SS2Core(app_manager.RyuApp, SS2App):
         instructions = [self.apply_actions(dp, actions),
                         self.goto_table(dp, self.config.table_eth_dst)]
         msgs += [self.flowmod(dp, self.config.table_eth_src,
-                              match=match,
+                              match=self.match(dp),
                               priority=self.config.priority_min,
                               instructions=instructions)]
 
         ## TABLE_ETH_DST
+        # With VLAN aware learning, everything without a host flow is flooded
+        # in its VLAN, multicast included
+        if self.config.vlan_mode:
+            for vid in self.vlans.vlans(dp.id):
+                match = self.host_match(dp, vid)
+                instructions = [self.apply_actions(
+                    dp, self.flood_actions(dp, vid))]
+                msgs += [self.flowmod(dp, self.config.table_eth_dst,
+                                      match=match,
+                                      priority=self.config.priority_min,
+                                      instructions=instructions)]
+            return msgs
+
         # Flood multicast (Mimic Faucet)
         flood_addrs = [
             ('01:80:c2:00:00:00', '01:80:c2:00:00:00'), # 802.x
@@ -168,8 +881,7 @@ class SS2Core(app_manager.RyuApp, SS2App):
             ('33:33:00:00:00:00', 'ff:ff:00:00:00:00'), # IPv6 multicast
             ('ff:ff:ff:ff:ff:ff', None) # Ethernet broadcast
         ]
-        actions = [self.action_output(dp, ofp.OFPP_FLOOD)]
-        instructions = [self.apply_actions(dp, actions)]
+        instructions = [self.apply_actions(dp, self.flood_actions(dp))]
         for eth_dst in flood_addrs:
             match = self.match(dp, eth_dst=eth_dst)
             msgs += [self.flowmod(dp, self.config.table_eth_dst,
@@ -179,33 +891,123 @@ class SS2Core(app_manager.RyuApp, SS2App):
 
         # Table-miss floods
         match = self.match(dp)
-        actions = [self.action_output(dp, ofp.OFPP_FLOOD)]
-        instructions = [self.apply_actions(dp, actions)]
+        instructions = [self.apply_actions(dp, self.flood_actions(dp))]
         msgs += [self.flowmod(dp, self.config.table_eth_dst,
                               match=match,
                               priority=self.config.priority_min,
                               instructions=instructions)]
         return msgs
 
-    def add_eth_src_flow(self, dp, in_port, eth_src):
+    def add_vlan_flows(self, dp):
+        """Add flows assigning packets to their VLAN in table_l2_switch
+
+        The VLAN is written to the metadata and tags are removed, so the
+        learning tables match hosts on the metadata and the flood groups and
+        eth_dst flows tag packets again for trunk ports. Tagged packets on
+        other ports and VLANs a trunk does not carry have no flow and are
+        dropped. Untagged packets on trunk ports are dropped as well, rather
+        than assigned to the native VLAN.
+        """
+
+        ofp = dp.ofproto
+
+        def _assign(match, vid, actions):
+            "Helper to create a flow writing vid to the metadata"
+            instructions = [self.write_metadata(dp, vid, VLAN_METADATA_MASK),
+                            self.goto_table(dp, self.config.table_eth_src)]
+            if actions:
+                instructions.insert(0, self.apply_actions(dp, actions))
+            return [self.flowmod(dp, self.config.table_l2_switch,
+                                 match=match,
+                                 priority=self.config.priority_low,
+                                 instructions=instructions)]
+
+        msgs = []
+        for port, vid in self.vlans.access_ports(dp.id):
+            match = self.match(dp, in_port=port, vlan_vid=ofp.OFPVID_NONE)
+            msgs += _assign(match, vid, [])
+        for port, vids in self.vlans.trunk_ports(dp.id):
+            for vid in vids:
+                match = self.match(dp, in_port=port,
+                                   vlan_vid=vid | ofp.OFPVID_PRESENT)
+                msgs += _assign(match, vid, [self.action_pop_vlan(dp)])
+            msgs += [self.flowmod(dp, self.config.table_l2_switch,
+                                  match=self.match(dp, in_port=port,
+                                                   vlan_vid=ofp.OFPVID_NONE),
+                                  priority=self.config.priority_low,
+                                  instructions=[])]
+
+        # Untagged packets on other ports belong to the native VLAN
+        match = self.match(dp, vlan_vid=ofp.OFPVID_NONE)
+        instructions = [self.write_metadata(dp, self.vlans.native,
+                                            VLAN_METADATA_MASK),
+                        self.goto_table(dp, self.config.table_eth_src)]
+        msgs += [self.flowmod(dp, self.config.table_l2_switch,
+                              match=match,
+                              priority=self.config.priority_min,
+                              instructions=instructions)]
+        return msgs
+
+    def add_eth_src_flow(self, dp, in_port, eth_src, vid=None):
         "Add flow to mark the source learned at a specific port"
 
-        match = self.match(dp, eth_src=eth_src, in_port=in_port)
+        match = self.host_match(dp, vid, eth_src=eth_src, in_port=in_port)
         instructions = [self.goto_table(dp, self.config.table_eth_dst)]
         return [self.flowmod(dp, self.config.table_eth_src,
-                             hard_timeout=self.config.learn_timeout,
+                             hard_timeout=self.learn_timeout(dp, eth_src, vid),
                              match=match,
                              instructions=instructions,
                              priority=self.config.priority_high)]
 
-    def add_eth_dst_flow(self, dp, out_port, eth_dst):
-        "Add flow to forward packet sent to eth_dst to out_port"
+    def add_damped_flow(self, dp, eth_src, vid=None):
+        """Add flow to handle a suppressed host without the controller
+
+        Depending on flap_policy, packets from the host on ports other than
+        the one it is pinned to are either forwarded without relearning or
+        dropped. The flow expires once the host can be learned again. It sits
+        below the (in_port, eth_src) flow of the pinned port, so packets from
+        that port are still forwarded.
+        """
+
+        match = self.host_match(dp, vid, eth_src=eth_src)
+        if self.config.flap_policy == "drop":
+            instructions = []
+        else:
+            instructions = [self.goto_table(dp, self.config.table_eth_dst)]
+        hard_timeout = self.flaps.reuse_time(dp.id, eth_src, vid)
+        return [self.flowmod(dp, self.config.table_eth_src,
+                             hard_timeout=hard_timeout,
+                             match=match,
+                             instructions=instructions,
+                             priority=self.config.priority_low)]
+
+    def add_link_port_flow(self, dp, in_port):
+        """Add flow to skip learning on a port connected to another datapath
+
+        Hosts behind the port are learned at their own edge and distributed,
+        so packets from the port do not need to be sent to the controller.
+        """
+
+        match = self.match(dp, in_port=in_port)
+        instructions = [self.goto_table(dp, self.config.table_eth_dst)]
+        return [self.flowmod(dp, self.config.table_eth_src,
+                             match=match,
+                             instructions=instructions,
+                             priority=self.config.priority_mid)]
+
+    def add_eth_dst_flow(self, dp, out_port, eth_dst, vid=None):
+        "Add flow to forward packet sent to eth_dst in VLAN vid to out_port"
 
-        match = self.match(dp, eth_dst=eth_dst)
-        actions = [self.action_output(dp, out_port)]
+        match = self.host_match(dp, vid, eth_dst=eth_dst)
+        actions = self.output_actions(dp, out_port, vid)
         instructions = [self.apply_actions(dp, actions)]
+        flags = None
+        if self.config.host_eviction:
+            # Keeps the host count accurate when the flow idles out
+            flags = dp.ofproto.OFPFF_SEND_FLOW_REM
         return [self.flowmod(dp, self.config.table_eth_dst,
-                             idle_timeout=self.config.learn_timeout,
+                             idle_timeout=self.learn_timeout(dp, eth_dst, vid),
+                             flags=flags,
                              match=match,
                              instructions=instructions,
                              priority=self.config.priority_high)]
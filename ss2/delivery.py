@@ -0,0 +1,190 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Pipelined message delivery for Simple Switch 2.0 (SS2)
+"""
+
+import collections
+import logging
+import time
+
+class _Batch(object):
+    "Basic class to hold a group of messages sent together to a datapath"
+
+    def __init__(self, msgs, context, on_error):
+        self.msgs = msgs
+        self.context = context
+        self.on_error = on_error
+        self.xids = []
+        self.failed = False
+        self.timestamp = time.time()
+
+class DeliveryQueue(object):
+    """Sends messages to a datapath with a bounded number in flight
+
+    Messages are sent in batches, each followed by a barrier request. A batch
+    is confirmed when its barrier reply arrives, and since datapaths process
+    barriers in order, so is every batch sent before it. Errors are matched to
+    their batch by xid. Batches that would exceed the window wait in a bounded
+    queue; batches that do not fit in the queue are dropped and reported.
+
+    on_error callbacks are called as on_error(context, msg, error) with the
+    failed message and error message, or None for both if the batch was
+    dropped or timed out.
+    """
+
+    def __init__(self, dp, barrier_request, window, queue_limit, timeout):
+        self.dp = dp
+        self.barrier_request = barrier_request
+        # {barrier xid: batch} in the order they were sent
+        self.inflight = collections.OrderedDict()
+        self.inflight_msgs = 0
+        # {xid: batch} for every message of the batches in flight
+        self.xids = {}
+        self.queue = collections.deque()
+        self.logger = logging.getLogger("SS2DeliveryQueue")
+        self.window = window
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.stats = {'sent': 0, 'confirmed': 0, 'failed': 0, 'dropped': 0}
+
+    def send(self, msgs, context=None, on_error=None):
+        "Queue a batch of messages, returns False if the batch was dropped"
+
+        if not msgs:
+            return True
+
+        self.expire()
+        batch = _Batch(list(msgs), context, on_error)
+        if len(self.queue) >= self.queue_limit:
+            self.stats['dropped'] += 1
+            self.logger.warning("Dropped %d messages to %s, queue full",
+                                len(batch.msgs), self.dp.id)
+            self._fail(batch, None, None)
+            return False
+
+        self.queue.append(batch)
+        self._drain()
+        return True
+
+    def _drain(self):
+        "Send queued batches while they fit in the window"
+
+        while self.queue:
+            size = len(self.queue[0].msgs) + 1
+            if self.inflight and self.inflight_msgs + size > self.window:
+                break
+            self._transmit(self.queue.popleft())
+
+    def _transmit(self, batch):
+        "Send a batch followed by a barrier request"
+
+        for msg in batch.msgs + [self.barrier_request(self.dp)]:
+            # Keep xids already assigned by the caller
+            xid = msg.xid
+            if xid == None:
+                xid = self.dp.set_xid(msg)
+            batch.xids.append(xid)
+            self.xids[xid] = batch
+            self.dp.send_msg(msg)
+
+        batch.timestamp = time.time()
+        self.inflight[batch.xids[-1]] = batch
+        self.inflight_msgs += len(batch.xids)
+        self.stats['sent'] += 1
+
+    def _finish(self, batch):
+        "Forget a batch that is no longer in flight"
+
+        for xid in batch.xids:
+            self.xids.pop(xid, None)
+        self.inflight_msgs -= len(batch.xids)
+
+    def _fail(self, batch, msg, error):
+        "Report a failed batch once"
+
+        if batch.failed:
+            return
+        batch.failed = True
+        self.stats['failed'] += 1
+        if batch.on_error != None:
+            batch.on_error(batch.context, msg, error)
+
+    def barrier_reply(self, xid):
+        "Confirm batches up to the barrier xid, returns False if not ours"
+
+        if xid not in self.inflight:
+            return False
+
+        while self.inflight:
+            barrier_xid, batch = self.inflight.popitem(last=False)
+            self._finish(batch)
+            if not batch.failed:
+                self.stats['confirmed'] += 1
+            if barrier_xid == xid:
+                break
+
+        self._drain()
+        return True
+
+    def error(self, xid, error):
+        "Report the batch that caused an error, returns False if not ours"
+
+        batch = self.xids.get(xid, None)
+        if batch == None:
+            return False
+
+        # The last xid is our own barrier request
+        index = batch.xids.index(xid)
+        msg = batch.msgs[index] if index < len(batch.msgs) else None
+        self._fail(batch, msg, error)
+        return True
+
+    def expire(self):
+        """Give up on batches without a barrier reply within self.timeout
+
+        A missing reply for the oldest batch means the datapath lost or is not
+        processing our messages, so everything in flight is failed.
+        """
+
+        if not self.inflight:
+            return
+
+        oldest = next(iter(self.inflight.values()))
+        if oldest.timestamp + self.timeout >= time.time():
+            return
+
+        self.logger.warning("No barrier reply from %s for %d messages",
+                            self.dp.id, self.inflight_msgs)
+        while self.inflight:
+            _, batch = self.inflight.popitem(last=False)
+            self._finish(batch)
+            self._fail(batch, None, None)
+        self._drain()
+
+    def status(self):
+        "Returns a dict of delivery counters and current queue sizes"
+
+        status = dict(self.stats)
+        status['inflight'] = self.inflight_msgs
+        status['queued'] = len(self.queue)
+        return status
@@ -0,0 +1,118 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+SimpleSwitch 2.0 (SS2) LLDP Link Discovery
+
+Sends LLDP frames identifying the datapath and port out of every port of the
+datapaths of the Core application. Frames received on another datapath are
+links between the two, recorded in the app's Topology. Links that are not
+seen again within lldp_miss_count intervals expire.
+"""
+
+import struct
+from ryu.lib import hub
+from ryu.lib.packet import ethernet, ether_types as ether, lldp, packet
+
+class LinkDiscovery(object):
+    """LLDP link discovery methods of SS2Core
+
+    Link ports skip learning and are left out of the flood groups, so both
+    are updated whenever a link comes or goes.
+    """
+
+    def lldp_loop(self):
+        "Periodically send LLDP out of every port and expire stale links"
+
+        while True:
+            for dp in list(self.datapaths.values()):
+                msgs = []
+                for port, hw_addr in self.ports.get(dp.id, {}).items():
+                    msgs += self.lldp_packet_out(dp, port, hw_addr)
+                self.send_msgs(dp, msgs)
+
+            self.remove_link_ports(self.topology.expire_links())
+            hub.sleep(self.config.lldp_interval)
+
+    def lldp_packet_out(self, dp, port, hw_addr):
+        "Generate a packet-out of an LLDP frame identifying dp and port"
+
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet(dst=lldp.LLDP_MAC_NEAREST_BRIDGE,
+                                           src=hw_addr,
+                                           ethertype=ether.ETH_TYPE_LLDP))
+        tlvs = (
+            lldp.ChassisID(subtype=lldp.ChassisID.SUB_LOCALLY_ASSIGNED,
+                           chassis_id=("dpid:%016x" % dp.id).encode("ascii")),
+            lldp.PortID(subtype=lldp.PortID.SUB_PORT_COMPONENT,
+                        port_id=struct.pack("!I", port)),
+            lldp.TTL(ttl=int(self.config.lldp_interval *
+                             self.config.lldp_miss_count)),
+            lldp.End()
+        )
+        pkt.add_protocol(lldp.lldp(tlvs))
+        pkt.serialize()
+
+        actions = [self.action_output(dp, port)]
+        return [self.packet_out(dp, actions, pkt.data)]
+
+    def handle_lldp(self, dp, in_port, pkt):
+        "Learn a link from an LLDP frame sent by lldp_packet_out"
+
+        lldp_pkt = pkt.get_protocol(lldp.lldp)
+        if lldp_pkt == None or len(lldp_pkt.tlvs) < 2:
+            return
+
+        chassis_id = lldp_pkt.tlvs[0].chassis_id
+        port_id = lldp_pkt.tlvs[1].port_id
+        if not chassis_id.startswith(b"dpid:") or len(port_id) != 4:
+            # Not one of ours (host or other LLDP agent)
+            return
+
+        peer_dpid = int(chassis_id[5:], 16)
+        peer_port = struct.unpack("!I", port_id)[0]
+        if not self.topology.add_link(peer_dpid, peer_port, dp.id, in_port):
+            return
+
+        # Hosts learned on the ports before the link was known are behind
+        # the link, not at the edge
+        for dpid, port in [(peer_dpid, peer_port), (dp.id, in_port)]:
+            link_dp = self.datapaths.get(dpid, None)
+            if link_dp != None:
+                msgs = self.add_link_port_flow(link_dp, port)
+                msgs += self.unlearn_port(link_dp, port)
+                self.send_msgs(link_dp, msgs)
+        if self.uses_flood_groups():
+            self.update_flood_groups()
+        self.distribute_hosts()
+
+    def remove_link_ports(self, ends):
+        "Remove the link port flows for the list of (dpid, port) link ends"
+
+        for dpid, port in ends:
+            dp = self.datapaths.get(dpid, None)
+            if dp != None:
+                self.send_msgs(dp, [self.flowdel(
+                    dp, self.config.table_eth_src,
+                    match=self.match(dp, in_port=port))])
+
+        if ends and self.uses_flood_groups():
+            self.update_flood_groups()
@@ -0,0 +1,136 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+MAC flap damping for Simple Switch 2.0 (SS2)
+"""
+
+import logging
+import math
+import time
+
+class _FlapEntry(object):
+    "Basic class to hold the flap damping state of a host"
+
+    def __init__(self, port):
+        self.port = port
+        self.penalty = 0.0
+        self.flaps = 0
+        self.suppressed = False
+        self.timestamp = time.time()
+
+class FlapDamper(object):
+    """Detects hosts moving between ports and damps their relearning
+
+    Every move of a MAC to a different port on the same datapath adds a
+    penalty which decays exponentially with the configured half life. Once the
+    penalty reaches the suppress threshold the host is pinned to the port it
+    was on until the penalty decays below the reuse threshold.
+    """
+
+    def __init__(self, penalty, suppress, reuse, half_life, max_penalty):
+        self.entries = {}
+        self.logger = logging.getLogger("SS2FlapDamper")
+        self.penalty = penalty
+        self.suppress = suppress
+        self.reuse = reuse
+        self.half_life = half_life
+        self.max_penalty = max_penalty
+        self.last_clean = time.time()
+
+    def _decay(self, entry, curtime):
+        "Decay the penalty of entry up to curtime"
+
+        elapsed = curtime - entry.timestamp
+        entry.penalty *= 0.5 ** (elapsed / float(self.half_life))
+        entry.timestamp = curtime
+
+    def learn(self, dpid, port, mac, vid=None):
+        """Record that mac was seen at dpid/port in vid
+
+        Returns False if the host is suppressed and should stay at the port it
+        is pinned to, True if it can be learned at port.
+        """
+
+        curtime = time.time()
+        if curtime - self.last_clean > self.half_life:
+            self.clean_entries()
+
+        entry = self.entries.get((dpid, mac, vid), None)
+        if entry == None:
+            self.entries[(dpid, mac, vid)] = _FlapEntry(port)
+            return True
+
+        self._decay(entry, curtime)
+        if entry.suppressed and entry.penalty < self.reuse:
+            entry.suppressed = False
+            self.logger.info("Reusing %s, %s", dpid, mac)
+
+        if port != entry.port:
+            entry.flaps += 1
+            entry.penalty = min(entry.penalty + self.penalty, self.max_penalty)
+            self.logger.info("Flap %s, %s from port %s to %s (penalty %d)",
+                             dpid, mac, entry.port, port, entry.penalty)
+
+        if not entry.suppressed and entry.penalty >= self.suppress:
+            entry.suppressed = True
+            self.logger.warning("Suppressed %s, %s at port %s for %ds",
+                                dpid, mac, entry.port,
+                                self.reuse_time(dpid, mac, vid))
+
+        if entry.suppressed:
+            return port == entry.port
+
+        entry.port = port
+        return True
+
+    def reuse_time(self, dpid, mac, vid=None):
+        "Seconds until a suppressed host decays below the reuse threshold"
+
+        entry = self.entries.get((dpid, mac, vid), None)
+        if entry == None or not entry.suppressed:
+            return 0
+        # At least a second, a hard timeout of 0 would never expire
+        return max(1, int(math.ceil(self.half_life *
+                                    math.log(entry.penalty / self.reuse, 2))))
+
+    def state(self):
+        "Returns a list of dicts describing every host with a flap penalty"
+
+        curtime = time.time()
+        state = []
+        for (dpid, mac, vid), entry in sorted(self.entries.items()):
+            self._decay(entry, curtime)
+            state.append({'dpid': dpid, 'mac': mac, 'vid': vid,
+                          'port': entry.port,
+                          'flaps': entry.flaps, 'penalty': entry.penalty,
+                          'suppressed': entry.suppressed})
+        return state
+
+    def clean_entries(self):
+        "Clean entries whose penalty decayed to nothing"
+
+        curtime = time.time()
+        for key, entry in list(self.entries.items()):
+            self._decay(entry, curtime)
+            if not entry.suppressed and entry.penalty < 1:
+                del self.entries[key]
+        self.last_clean = curtime
@@ -0,0 +1,166 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Multicast group membership for Simple Switch 2.0 (SS2)
+"""
+
+import heapq
+import itertools
+import logging
+import socket
+import time
+
+def multicast_mac(address):
+    "Returns the Ethernet multicast MAC for an IPv4 or IPv6 group address"
+
+    if ":" in address:
+        low = socket.inet_pton(socket.AF_INET6, address)[-4:]
+        octets = [0x33, 0x33] + list(bytearray(low))
+    else:
+        low = bytearray(socket.inet_aton(address))[-3:]
+        octets = [0x01, 0x00, 0x5e, low[0] & 0x7f, low[1], low[2]]
+    return ":".join("%02x" % octet for octet in octets)
+
+class MulticastGroups(object):
+    """Keeps track of multicast group members and router ports per datapath
+
+    Groups are identified by their multicast MAC since that is what the
+    datapath forwards on. Every membership has an expiry time which is also
+    pushed on a heap, so expiring only looks at memberships that are due.
+    Heap entries for memberships that were refreshed since are skipped.
+    """
+
+    def __init__(self, timeout, router_timeout):
+        # {(dpid, group): {port: expiry}}
+        self.members = {}
+        # {dpid: {port: expiry}}, expiry is None for static router ports
+        self.routers = {}
+        # Heap of (expiry, sequence, dpid, group, port). The sequence keeps
+        # entries with the same expiry from comparing group against None.
+        self.expiry = []
+        self.sequence = itertools.count()
+        self.logger = logging.getLogger("SS2MulticastGroups")
+        self.timeout = timeout
+        self.router_timeout = router_timeout
+
+    def join(self, dpid, group, port):
+        "Add or refresh a member port, returns True if the port is new"
+
+        expiry = time.time() + self.timeout
+        ports = self.members.setdefault((dpid, group), {})
+        new = port not in ports
+        ports[port] = expiry
+        self._push(expiry, dpid, group, port)
+        if new:
+            self.logger.debug("Joined %s, %s, %s", dpid, port, group)
+        return new
+
+    def _push(self, expiry, dpid, group, port):
+        "Schedule a membership (or router port if group is None) to expire"
+
+        heapq.heappush(self.expiry,
+                       (expiry, next(self.sequence), dpid, group, port))
+
+    def leave(self, dpid, group, port, delay=0):
+        """Remove a member port after delay seconds
+
+        Returns True if the port was removed straight away. With a delay, the
+        membership expires unless the port reports again before then.
+        """
+
+        ports = self.members.get((dpid, group), {})
+        if port not in ports:
+            return False
+
+        if delay:
+            expiry = min(ports[port], time.time() + delay)
+            ports[port] = expiry
+            self._push(expiry, dpid, group, port)
+            return False
+
+        self._remove_member(dpid, group, port)
+        return True
+
+    def _remove_member(self, dpid, group, port):
+        "Remove a member port and the group once it has no members"
+
+        ports = self.members[(dpid, group)]
+        del ports[port]
+        if not ports:
+            del self.members[(dpid, group)]
+        self.logger.debug("Left %s, %s, %s", dpid, port, group)
+
+    def add_router_port(self, dpid, port, static=False):
+        "Add or refresh a port with a multicast router, returns True if new"
+
+        routers = self.routers.setdefault(dpid, {})
+        new = port not in routers
+        if static or routers.get(port, 0) == None:
+            routers[port] = None
+        else:
+            expiry = time.time() + self.router_timeout
+            routers[port] = expiry
+            self._push(expiry, dpid, None, port)
+        return new
+
+    def groups(self, dpid):
+        "Returns the groups with members on dpid"
+
+        return [group for (_dpid, group) in self.members if _dpid == dpid]
+
+    def ports(self, dpid, group):
+        "Returns the sorted list of ports to forward group traffic to on dpid"
+
+        ports = set(self.members.get((dpid, group), {}))
+        if not ports:
+            return []
+        ports.update(self.routers.get(dpid, {}))
+        return sorted(ports)
+
+    def expire(self):
+        "Remove expired memberships, returns a set of changed (dpid, group)"
+
+        curtime = time.time()
+        changed = set()
+        while self.expiry and self.expiry[0][0] < curtime:
+            expiry, _, dpid, group, port = heapq.heappop(self.expiry)
+            if group == None:
+                routers = self.routers.get(dpid, {})
+                if routers.get(port, None) == expiry:
+                    del routers[port]
+                    changed.update((dpid, g) for g in self.groups(dpid))
+            elif self.members.get((dpid, group), {}).get(port, None) == expiry:
+                self._remove_member(dpid, group, port)
+                changed.add((dpid, group))
+
+        return changed
+
+    def remove_datapath(self, dpid):
+        "Forget all memberships and dynamic router ports on dpid"
+
+        for key in list(self.members.keys()):
+            if key[0] == dpid:
+                del self.members[key]
+        routers = self.routers.get(dpid, {})
+        for port, expiry in list(routers.items()):
+            if expiry != None:
+                del routers[port]
@@ -0,0 +1,127 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+SimpleSwitch 2.0 (SS2) ARP and IPv6 Neighbor Discovery Proxy
+
+ARP requests and neighbor solicitations are punted from the L2 switch table by
+the proxy flows of the Core application. Requests for hosts with a known
+address binding are answered by the controller, all others are flooded.
+"""
+
+from ryu.lib.packet import arp, ethernet, ether_types as ether, icmpv6
+from ryu.lib.packet import in_proto, ipv6, packet, vlan
+
+class AddressProxy(object):
+    """Address proxy methods of SS2Core
+
+    Uses the AddressTable of the app in self.addresses, and its VLAN map and
+    topology to tell where a request came from.
+    """
+
+    def handle_address_request(self, dp, in_port, pkt):
+        """Answer an ARP request or neighbor solicitation for a known host
+
+        The sender binding is recorded first. Requests for unknown targets,
+        gratuitous requests and duplicate address detection are flooded as the
+        datapath would have done without the proxy. With VLAN aware learning
+        the requests are punted before the VLAN is assigned, so it is derived
+        from the port and the VLAN tag of the request.
+        """
+
+        eth = pkt.get_protocol(ethernet.ethernet)
+        arp_pkt = pkt.get_protocol(arp.arp)
+        ip6 = pkt.get_protocol(ipv6.ipv6)
+        icmp6 = pkt.get_protocol(icmpv6.icmpv6)
+        edge = not self.topology.is_link_port(dp.id, in_port)
+
+        tag = pkt.get_protocol(vlan.vlan)
+        vid = None
+        if self.config.vlan_mode:
+            vid = self.vlans.classify(dp.id, in_port,
+                                      tag.vid if tag != None else None)
+            if vid == None:
+                return
+
+        reply = None
+        if arp_pkt != None and arp_pkt.opcode == arp.ARP_REQUEST:
+            if edge:
+                self.addresses.update(arp_pkt.src_ip, dp.id, in_port,
+                                      arp_pkt.src_mac, vid)
+            target = self.addresses.lookup(arp_pkt.dst_ip, vid)
+            if target != None and arp_pkt.src_ip != arp_pkt.dst_ip:
+                reply = self.arp_reply(eth, arp_pkt, target.mac)
+        elif icmp6 != None and icmp6.type_ == icmpv6.ND_NEIGHBOR_SOLICIT:
+            if ip6.src == "::":
+                target = None
+            else:
+                if edge:
+                    self.addresses.update(ip6.src, dp.id, in_port, eth.src,
+                                          vid)
+                target = self.addresses.lookup(icmp6.data.dst, vid)
+            if target != None:
+                reply = self.nd_advert(eth, ip6, icmp6, target.mac)
+
+        if reply != None:
+            # Sent from the controller port, a switch drops packets output to
+            # the in_port of the packet-out
+            actions = self.output_actions(dp, in_port, vid)
+            msg = self.packet_out(dp, actions, reply.data)
+        else:
+            actions = self.flood_actions(dp, vid)
+            if tag != None and vid != None:
+                # The VLAN flood group tags the packet for trunk ports itself
+                actions = [self.action_pop_vlan(dp)] + actions
+            msg = self.packet_out(dp, actions, pkt.data, in_port=in_port)
+        self.send_msgs(dp, [msg])
+
+    @staticmethod
+    def arp_reply(eth, arp_pkt, target_mac):
+        "Build the ARP reply to arp_pkt on behalf of target_mac"
+
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet(dst=eth.src, src=target_mac,
+                                           ethertype=ether.ETH_TYPE_ARP))
+        pkt.add_protocol(arp.arp(opcode=arp.ARP_REPLY,
+                                 src_mac=target_mac, src_ip=arp_pkt.dst_ip,
+                                 dst_mac=arp_pkt.src_mac,
+                                 dst_ip=arp_pkt.src_ip))
+        pkt.serialize()
+        return pkt
+
+    @staticmethod
+    def nd_advert(eth, ip6, icmp6, target_mac):
+        "Build the solicited neighbor advertisement for target_mac"
+
+        target_ip = icmp6.data.dst
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet(dst=eth.src, src=target_mac,
+                                           ethertype=ether.ETH_TYPE_IPV6))
+        pkt.add_protocol(ipv6.ipv6(src=target_ip, dst=ip6.src,
+                                   nxt=in_proto.IPPROTO_ICMPV6,
+                                   hop_limit=255))
+        # res flags: solicited and override
+        option = icmpv6.nd_option_tla(hw_src=target_mac)
+        pkt.add_protocol(icmpv6.icmpv6(
+            type_=icmpv6.ND_NEIGHBOR_ADVERT,
+            data=icmpv6.nd_neighbor(res=3, dst=target_ip, option=option)))
+        pkt.serialize()
+        return pkt
@@ -0,0 +1,272 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+SimpleSwitch 2.0 (SS2) REST API
+
+Exports the hosts learned by the SS2 Core application and the flows installed
+for them. Start it together with the Core application:
+
+    $ ryu-manager ss2.core ss2.rest
+
+Endpoints, all returning JSON lines (one JSON object per line):
+
+    GET /ss2/hosts   Hosts with flows on each datapath
+    GET /ss2/flows   Flows installed for those hosts
+    GET /ss2/flaps   MAC flap damping state
+    GET /ss2/acl     Hit counters of the ACL rules, summed over all datapaths,
+                     when the ACL application runs with rule_stats enabled
+    GET /ss2/delivery
+                     Delivery counters and queue sizes of every app and
+                     datapath, when pipelined_delivery is enabled
+
+/ss2/hosts and /ss2/flows accept the `dpid`, `port`, `mac` and `vid` query
+parameters to filter the results, and `limit` (default 1000, 0 for no limit)
+to page through them. When a page is full, the last line is
+`{"next": "<cursor>"}`. Pass the cursor as the `cursor` query parameter to get
+the next page. Results are streamed while they are generated so large tables
+do not need to fit in a single response body in memory.
+"""
+
+import json
+from .core import VLAN_METADATA_MASK
+from ryu.app.wsgi import ControllerBase, WSGIApplication, route
+from ryu.base import app_manager
+from ryu.lib import hub
+from ryu.lib.packet.ether_types import ETH_TYPE_8021Q
+from webob import Response
+
+# Number of lines sent between giving other green threads a chance to run
+YIELD_INTERVAL = 100
+DEFAULT_LIMIT = 1000
+# SS2 apps that can send messages through delivery queues
+DELIVERY_APPS = ['SS2Core', 'SS2ACL', 'SS2Snooping']
+
+
+class SS2Rest(app_manager.RyuApp):
+    "SS2 REST API RyuApp"
+    _CONTEXTS = {'wsgi': WSGIApplication}
+
+    def __init__(self, *args, **kwargs):
+        super(SS2Rest, self).__init__(*args, **kwargs)
+        kwargs['wsgi'].register(SS2RestController, {})
+
+
+class SS2RestController(ControllerBase):
+    "WSGI controller for the SS2 REST API"
+
+    ## Routes
+
+    @route('ss2', '/ss2/hosts', methods=['GET'])
+    def list_hosts(self, req, **_kwargs):
+        "Stream the learned hosts"
+
+        return self.stream(req, self.host_record)
+
+    @route('ss2', '/ss2/flows', methods=['GET'])
+    def list_flows(self, req, **_kwargs):
+        "Stream the flows installed for the learned hosts"
+
+        return self.stream(req, self.flow_records)
+
+    @route('ss2', '/ss2/flaps', methods=['GET'])
+    def list_flaps(self, _req, **_kwargs):
+        "Stream the flap damping state of hosts"
+
+        core = self.core()
+        if core == None:
+            return Response(status=503, body=b"SS2Core is not running\n")
+
+        return self.response(json.dumps(state) for state in core.flaps.state())
+
+    @route('ss2', '/ss2/acl', methods=['GET'])
+    def list_acl_counters(self, _req, **_kwargs):
+        "Stream the hit counters and rates of the ACL rules"
+
+        acl = app_manager.lookup_service_brick('SS2ACL')
+        if acl == None:
+            return Response(status=503, body=b"SS2ACL is not running\n")
+
+        return self.response(json.dumps(counter)
+                             for counter in acl.rule_counters())
+
+    @route('ss2', '/ss2/delivery', methods=['GET'])
+    def list_delivery(self, _req, **_kwargs):
+        "Stream the delivery queue status of every running SS2 app"
+
+        return self.response(json.dumps(status)
+                             for status in self.delivery_status())
+
+    ## Helper Methods
+
+    @staticmethod
+    def core():
+        "Returns the running SS2Core instance, or None"
+
+        return app_manager.lookup_service_brick('SS2Core')
+
+    @staticmethod
+    def delivery_status():
+        "Yields the status of each delivery queue with its app and dpid"
+
+        for name in DELIVERY_APPS:
+            app = app_manager.lookup_service_brick(name)
+            if app == None:
+                continue
+            for dpid, queue in sorted(app.delivery_queues().items()):
+                status = queue.status()
+                status.update({'app': name, 'dpid': dpid})
+                yield status
+
+    @staticmethod
+    def response(lines):
+        "Generate a streamed JSON lines response from an iterable of strings"
+
+        def _body():
+            "Encode lines, regularly giving other green threads a chance"
+            for count, line in enumerate(lines):
+                if count and count % YIELD_INTERVAL == 0:
+                    hub.sleep(0)
+                yield (line + "\n").encode("utf-8")
+
+        return Response(content_type='application/x-ndjson', app_iter=_body())
+
+    def stream(self, req, records):
+        """Stream records for the hosts matching the request's query
+
+        records(core, host) returns the list of JSON serializable records to
+        send for one host.
+        """
+
+        core = self.core()
+        if core == None:
+            return Response(status=503, body=b"SS2Core is not running\n")
+
+        try:
+            dpid = self.int_param(req, 'dpid')
+            port = self.int_param(req, 'port')
+            vid = self.int_param(req, 'vid')
+            limit = self.int_param(req, 'limit')
+            after = None
+            if req.GET.get('cursor'):
+                # dpid/mac, followed by /vid with VLAN aware learning
+                cursor = req.GET['cursor'].split("/")
+                after = (int(cursor[0], 0), cursor[1].lower(),
+                         int(cursor[2], 0) if len(cursor) > 2 else None)
+        except (ValueError, IndexError):
+            return Response(status=400, body=b"Invalid query parameter\n")
+
+        mac = req.GET.get('mac', None)
+        if mac != None:
+            mac = mac.lower()
+        if limit == None:
+            limit = DEFAULT_LIMIT
+
+        hosts = core.learned.iterate(dpid=dpid, port=port, mac=mac, vid=vid,
+                                     after=after, pause=YIELD_INTERVAL)
+
+        def _lines():
+            "Generate the JSON lines for each host, up to limit hosts"
+            count = 0
+            last = None
+            for host in hosts:
+                if host == None:
+                    # Filters can skip many hosts between two lines
+                    hub.sleep(0)
+                    continue
+                if limit and count == limit:
+                    cursor = "%d/%s" % (last.dpid, last.mac)
+                    if last.vid != None:
+                        cursor += "/%d" % last.vid
+                    yield json.dumps({'next': cursor})
+                    return
+                for record in records(core, host):
+                    yield json.dumps(record)
+                last = host
+                count += 1
+
+        return self.response(_lines())
+
+    @staticmethod
+    def int_param(req, name):
+        "Parse an integer query parameter, accepting hex with 0x"
+
+        value = req.GET.get(name, None)
+        if value == None:
+            return None
+        return int(value, 0)
+
+    @staticmethod
+    def host_record(core, host):
+        "Returns the records for a host"
+
+        return [{'dpid': host.dpid, 'port': host.port, 'mac': host.mac,
+                 'vid': host.vid, 'learned': host.timestamp,
+                 'edge': not core.topology.is_link_port(host.dpid, host.port)}]
+
+    @staticmethod
+    def flow_records(core, host):
+        """Returns the records for the flows installed for a host
+
+        Every host has an eth_dst flow. Hosts learned at an edge port also
+        have an eth_src flow, hosts distributed from another datapath do not.
+        With VLAN aware learning, both match the VLAN in the metadata. The
+        timeouts are the ones the flows were installed with. Flows that are
+        not for a learned host, such as the flows of damped hosts and link
+        ports, are not listed.
+        """
+
+        if host.dpid not in core.datapaths:
+            return []
+
+        timeout = host.timeout
+        metadata = {}
+        actions = []
+        if host.vid != None:
+            metadata['metadata'] = "0x%x/0x%x" % (host.vid,
+                                                  VLAN_METADATA_MASK)
+            if core.vlans.is_trunk(host.dpid, host.port):
+                actions += [{'push_vlan': ETH_TYPE_8021Q},
+                            {'set_field': {'vlan_vid': host.vid}}]
+        actions += [{'output': host.port}]
+
+        flows = []
+        if not core.topology.is_link_port(host.dpid, host.port):
+            match = {'in_port': host.port, 'eth_src': host.mac}
+            match.update(metadata)
+            flows.append({'dpid': host.dpid,
+                          'table_id': core.config.table_eth_src,
+                          'priority': core.config.priority_high,
+                          'cookie': core.config.cookie,
+                          'hard_timeout': timeout,
+                          'match': match,
+                          'instructions': [{
+                              'goto_table': core.config.table_eth_dst}]})
+        match = {'eth_dst': host.mac}
+        match.update(metadata)
+        flows.append({'dpid': host.dpid,
+                      'table_id': core.config.table_eth_dst,
+                      'priority': core.config.priority_high,
+                      'cookie': core.config.cookie,
+                      'idle_timeout': timeout,
+                      'match': match,
+                      'instructions': [{'apply_actions': actions}]})
+        return flows
@@ -0,0 +1,340 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+SimpleSwitch 2.0 (SS2) Sharded Controller Mode
+
+Runs several ryu-manager worker processes, each running SS2Core for a share
+of the datapaths. Every datapath connects to all workers. The worker that owns
+a datapath requests the OpenFlow master role for it and programs it, the other
+workers stay in the slave role and receive no packet-ins from it.
+
+Ownership is decided by rendezvous hashing of the dpid over the workers whose
+heartbeat in the shared state file is recent, so when a worker dies its
+datapaths move to the remaining workers without coordination. Learned hosts
+are kept in a shared memory table in the same file so a host moving between
+datapaths owned by different workers is detected.
+
+The supervisor is started with:
+
+    $ python -m ss2.shard --workers 4 ss2.core
+
+The ACL and Snooping applications program every datapath they are connected
+to, whatever shard owns it, so they cannot run sharded.
+"""
+
+import argparse
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+MAGIC = b"SS2S"
+VERSION = 1
+# magic, version, number of shards, number of host slots, role generation
+HEADER = struct.Struct("!4sHHIQ")
+HEADER_SIZE = 64
+# Heartbeat timestamp of each shard
+HEARTBEAT = struct.Struct("!d")
+# mac, shard, dpid, port, timestamp
+HOST = struct.Struct("!6sHQId4x")
+EMPTY_MAC = b"\0" * 6
+
+
+def mac_to_bytes(mac):
+    "Convert a MAC in 00:11:22:33:44:55 notation to 6 bytes"
+
+    return bytes(bytearray(int(octet, 16) for octet in mac.split(":")))
+
+
+class SharedHostEntry(object):
+    "Basic class to hold data on a host in the shared host table"
+
+    def __init__(self, shard, dpid, port, timestamp):
+        self.shard = shard
+        self.dpid = dpid
+        self.port = port
+        self.timestamp = timestamp
+
+
+class SharedState(object):
+    """Shard heartbeats and learned hosts shared between worker processes
+
+    The state lives in a memory mapped file. Hosts are kept in an open
+    addressing hash table keyed by MAC. All access is serialized with an
+    exclusive lock on the file, which keeps the table consistent between
+    processes.
+    """
+
+    def __init__(self, path, shard_count, host_slots, timeout):
+        self.logger = logging.getLogger("SS2SharedState")
+        self.path = path
+        self.shard_count = shard_count
+        self.host_slots = host_slots
+        self.timeout = timeout
+        self.hosts_offset = HEADER_SIZE + HEARTBEAT.size * shard_count
+        size = self.hosts_offset + HOST.size * host_slots
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with self.lock():
+            if os.fstat(self.fd).st_size == 0:
+                os.ftruncate(self.fd, size)
+                self.map = mmap.mmap(self.fd, size)
+                HEADER.pack_into(self.map, 0, MAGIC, VERSION, shard_count,
+                                 host_slots, 0)
+            else:
+                self.map = mmap.mmap(self.fd, size)
+
+        magic, version, shards, slots, _ = HEADER.unpack_from(self.map, 0)
+        if (magic, version, shards, slots) != \
+           (MAGIC, VERSION, shard_count, host_slots):
+            raise ValueError("%s was created for a different shard setup" %
+                             path)
+
+    def close(self):
+        "Unmap and close the state file"
+
+        self.map.close()
+        os.close(self.fd)
+
+    def lock(self):
+        "Context manager holding an exclusive lock on the state file"
+
+        return _FileLock(self.fd)
+
+    ## Shards
+
+    def heartbeat(self, shard):
+        "Mark a shard as alive"
+
+        with self.lock():
+            HEARTBEAT.pack_into(self.map, HEADER_SIZE + HEARTBEAT.size * shard,
+                                time.time())
+
+    def alive_shards(self):
+        "Returns the sorted list of shards with a heartbeat within timeout"
+
+        curtime = time.time()
+        alive = []
+        with self.lock():
+            for shard in range(self.shard_count):
+                offset = HEADER_SIZE + HEARTBEAT.size * shard
+                timestamp, = HEARTBEAT.unpack_from(self.map, offset)
+                if timestamp + self.timeout >= curtime:
+                    alive.append(shard)
+        return alive
+
+    def next_generation(self):
+        "Returns a new generation id for master role requests"
+
+        with self.lock():
+            header = list(HEADER.unpack_from(self.map, 0))
+            header[4] += 1
+            HEADER.pack_into(self.map, 0, *header)
+        return header[4]
+
+    @staticmethod
+    def owner(dpid, shards):
+        """Pick the shard owning dpid out of shards with rendezvous hashing
+
+        Only datapaths owned by a shard that is no longer in shards move to
+        another shard, all other datapaths keep their owner.
+        """
+
+        if not shards:
+            return None
+        def _weight(shard):
+            "Stable pseudo random weight of the shard for dpid"
+            digest = hashlib.md5(struct.pack("!QH", dpid, shard)).digest()
+            return struct.unpack("!I", digest[:4])[0], shard
+
+        return max(shards, key=_weight)
+
+    ## Hosts
+
+    def _slots(self, mac):
+        "Yields the slot offsets to probe for mac"
+
+        start = (zlib.crc32(mac) & 0xffffffff) % self.host_slots
+        for i in range(self.host_slots):
+            yield self.hosts_offset + HOST.size * \
+                ((start + i) % self.host_slots)
+
+    def learn(self, mac, shard, dpid, port):
+        """Record the location of a host
+
+        Returns the previous SharedHostEntry of the host, if it had one that
+        did not expire yet.
+        """
+
+        key = mac_to_bytes(mac)
+        if key == EMPTY_MAC:
+            # Marks free slots, and is not a valid host address either
+            return None
+
+        curtime = time.time()
+        with self.lock():
+            found = None
+            empty = None
+            expired = None
+            for offset in self._slots(key):
+                entry = HOST.unpack_from(self.map, offset)
+                if entry[0] == key:
+                    found = offset
+                    break
+                if entry[0] == EMPTY_MAC:
+                    empty = offset
+                    break
+                if expired == None and entry[4] + self.timeout < curtime:
+                    expired = offset
+
+            previous = None
+            if found != None:
+                _, old_shard, old_dpid, old_port, timestamp = \
+                    HOST.unpack_from(self.map, found)
+                if timestamp + self.timeout >= curtime:
+                    previous = SharedHostEntry(old_shard, old_dpid, old_port,
+                                               timestamp)
+            else:
+                # The whole chain was probed, so reusing an expired slot
+                # can not duplicate the host
+                found = expired if expired != None else empty
+                if found == None:
+                    self.logger.warning("Shared host table full, not "
+                                        "sharing %s", mac)
+                    return None
+
+            HOST.pack_into(self.map, found, key, shard, dpid, port, curtime)
+        return previous
+
+    def lookup(self, mac):
+        "Returns the SharedHostEntry of a host, or None if unknown or expired"
+
+        key = mac_to_bytes(mac)
+        with self.lock():
+            for offset in self._slots(key):
+                entry = HOST.unpack_from(self.map, offset)
+                if entry[0] == EMPTY_MAC:
+                    return None
+                if entry[0] == key:
+                    _, shard, dpid, port, timestamp = entry
+                    if timestamp + self.timeout < time.time():
+                        return None
+                    return SharedHostEntry(shard, dpid, port, timestamp)
+        return None
+
+
+class _FileLock(object):
+    "Exclusive fcntl lock on a file descriptor, used as a context manager"
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+
+## Supervisor
+
+# Applications that program every connected datapath instead of only those
+# owned by their shard
+UNSHARDED_APPS = ["ss2.acl", "ss2.snooping"]
+
+def worker_config(args, shard):
+    "Write the configuration file for a worker, returns its path"
+
+    path = "%s.shard-%d.cfg" % (args.state_file, shard)
+    with open(path, "w") as cfg:
+        cfg.write("[Core]\n")
+        cfg.write("shard_id: %d\n" % shard)
+        cfg.write("shard_count: %d\n" % args.workers)
+        cfg.write("shard_state_file: %s\n" % os.path.abspath(args.state_file))
+    return path
+
+def start_worker(args, shard):
+    "Start a ryu-manager process for a shard"
+
+    env = dict(os.environ)
+    env["SS2_CONFIG"] = worker_config(args, shard)
+    cmd = [args.ryu_manager,
+           "--ofp-tcp-listen-port", str(args.base_port + shard)] + args.apps
+    logging.info("Starting shard %d: %s", shard, " ".join(cmd))
+    return subprocess.Popen(cmd, env=env)
+
+def main(argv=None):
+    "Run SS2 worker processes and restart them when they exit"
+
+    parser = argparse.ArgumentParser(
+        description="Run SS2 sharded across several ryu-manager processes")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="number of worker processes")
+    parser.add_argument("--base-port", type=int, default=6653,
+                        help="OpenFlow port of the first worker, the others "
+                        "listen on the following ports")
+    parser.add_argument("--state-file", default="ss2-shards.state",
+                        help="shared state file")
+    parser.add_argument("--ryu-manager", default="ryu-manager",
+                        help="ryu-manager executable")
+    parser.add_argument("--restart-delay", type=float, default=1.0,
+                        help="seconds to wait before restarting a worker")
+    parser.add_argument("apps", nargs="*", default=["ss2.core"],
+                        help="Ryu applications to run in every worker")
+    args = parser.parse_args(argv)
+    unsharded = [app for app in args.apps if app in UNSHARDED_APPS]
+    if unsharded:
+        parser.error("%s cannot run sharded" % ", ".join(unsharded))
+    logging.basicConfig(level=logging.INFO)
+
+    # Start from a clean state file sized for this setup
+    if os.path.exists(args.state_file):
+        os.unlink(args.state_file)
+
+    workers = dict((shard, start_worker(args, shard))
+                   for shard in range(args.workers))
+    try:
+        while True:
+            time.sleep(args.restart_delay)
+            for shard, proc in list(workers.items()):
+                if proc.poll() != None:
+                    logging.warning("Shard %d exited with %s, restarting",
+                                    shard, proc.returncode)
+                    workers[shard] = start_worker(args, shard)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in workers.values():
+            if proc.poll() == None:
+                proc.terminate()
+        for proc in workers.values():
+            proc.wait()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+SimpleSwitch 2.0 (SS2) IGMP/MLD Snooping Controller Application
+
+Listens to IGMP and MLD messages punted from the L2 switch table and installs
+per-group flows in the eth_dst table that only forward to the member ports and
+multicast router ports. These flows have a higher priority than the multicast
+flood flows of the Core application, so groups without members and link-local
+groups are still flooded.
+"""
+
+from . import config, util
+from .app import SS2App
+from .multicast import MulticastGroups, multicast_mac
+from ryu.base import app_manager
+from ryu.controller import ofp_event
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import DEAD_DISPATCHER
+from ryu.controller.handler import set_ev_cls
+from ryu.lib import hub
+from ryu.lib.packet import ether_types as ether, icmpv6, igmp, in_proto
+from ryu.lib.packet import packet
+from ryu.ofproto import ofproto_v1_3
+
+# MLD message types
+MLD_TYPES = [icmpv6.MLD_LISTENER_QUERY, icmpv6.MLD_LISTENER_REPOR,
+             icmpv6.MLD_LISTENER_DONE, icmpv6.MLDV2_LISTENER_REPORT]
+
+# IGMPv3/MLDv2 group record types. Both protocols use the same values.
+JOIN_RECORDS = [igmp.MODE_IS_EXCLUDE, igmp.CHANGE_TO_EXCLUDE_MODE]
+SOURCE_RECORDS = [igmp.MODE_IS_INCLUDE, igmp.CHANGE_TO_INCLUDE_MODE,
+                  igmp.ALLOW_NEW_SOURCES]
+LEAVE_RECORDS = [igmp.MODE_IS_INCLUDE, igmp.CHANGE_TO_INCLUDE_MODE]
+
+# Groups in 224.0.0.0/24 and ff0x::/112 are always flooded. Other groups
+# sharing these MACs are flooded too.
+FLOODED_PREFIXES = ("01:00:5e:00:00:", "33:33:00:00:00:")
+
+
+class SS2Snooping(app_manager.RyuApp, SS2App):
+    "SS2 IGMP/MLD Snooping RyuApp"
+    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+
+    def __init__(self, *args, **kwargs):
+        super(SS2Snooping, self).__init__(*args, **kwargs)
+        self.config = config.read_config(section="Snooping")
+        # IGMP and MLD messages would be punted before the Core application
+        # assigns their VLAN, and the group flows do not match on it
+        if config.read_config().vlan_mode:
+            raise ValueError("The Snooping application does not support "
+                             "vlan_mode")
+        self.datapaths = {}
+        self.groups = MulticastGroups(self.config.membership_timeout,
+                                      self.config.router_timeout)
+        self.static_router_ports = util.parse_ports(self.config.router_ports)
+        self.expire_thread = hub.spawn(self.expire_loop)
+
+
+    ## Event Handlers
+
+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    def switch_features_handler(self, ev):
+        "Handle new datapaths attaching to Ryu"
+        dp = ev.msg.datapath
+        self.datapaths[dp.id] = dp
+
+        self.send_msgs(dp, self.add_datapath(dp))
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, DEAD_DISPATCHER)
+    def state_change_handler(self, ev):
+        "Forget datapaths that disconnect from Ryu"
+
+        dpid = ev.datapath.id
+        if dpid == None or self.datapaths.get(dpid) is not ev.datapath:
+            return
+
+        del self.datapaths[dpid]
+        self.groups.remove_datapath(dpid)
+
+    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    def packet_in_handler(self, ev):
+        "Handle IGMP and MLD messages punted by the snooping flows"
+
+        if not self.is_own_flow(ev.msg):
+            return
+
+        dp = ev.msg.datapath
+        in_port = ev.msg.match['in_port']
+        pkt = packet.Packet(ev.msg.data)
+
+        icmp6 = pkt.get_protocol(icmpv6.icmpv6)
+        if icmp6 != None:
+            changed = self.handle_mld(dp, in_port, icmp6)
+        else:
+            changed = self.handle_igmp(dp, in_port, pkt)
+
+        for group in changed:
+            self.send_msgs(dp, self.update_group_flow(dp, group))
+
+    ## Instance Helper Methods
+
+    def add_datapath(self, dp):
+        "Add the specified datapath to our app by adding default rules"
+
+        self.groups.remove_datapath(dp.id)
+        for dpid, port in self.static_router_ports:
+            if dpid == dp.id:
+                self.groups.add_router_port(dpid, port, static=True)
+
+        msgs = self.clean_all_flows(dp)
+        msgs += self.add_default_flows(dp)
+        return msgs
+
+    def add_default_flows(self, dp):
+        """Send IGMP and MLD messages to the controller
+
+        The messages also continue through the pipeline so the reports reach
+        other datapaths and the multicast routers.
+        """
+
+        ofp = dp.ofproto
+        matches = [self.match(dp, eth_type=ether.ETH_TYPE_IP,
+                              ip_proto=in_proto.IPPROTO_IGMP)]
+        for mld_type in MLD_TYPES:
+            matches += [self.match(dp, eth_type=ether.ETH_TYPE_IPV6,
+                                   ip_proto=in_proto.IPPROTO_ICMPV6,
+                                   icmpv6_type=mld_type)]
+
+        actions = [self.action_output(dp, ofp.OFPP_CONTROLLER,
+                                      max_len=ofp.OFPCML_NO_BUFFER)]
+        instructions = [self.apply_actions(dp, actions),
+                        self.goto_table(dp, self.config.table_eth_src)]
+        msgs = []
+        for match in matches:
+            msgs += [self.flowmod(dp, self.config.table_l2_switch,
+                                  match=match,
+                                  priority=self.config.priority_high,
+                                  instructions=instructions)]
+        return msgs
+
+    def handle_igmp(self, dp, in_port, pkt):
+        "Update memberships from an IGMP message, returns the changed groups"
+
+        report = pkt.get_protocol(igmp.igmpv3_report)
+        if report != None:
+            records = [(r.type_, r.num, r.address) for r in report.records]
+            return self.handle_records(dp, in_port, records)
+
+        if pkt.get_protocol(igmp.igmpv3_query) != None:
+            return self.add_router_port(dp, in_port)
+
+        msg = pkt.get_protocol(igmp.igmp)
+        if msg == None:
+            return set()
+        if msg.msgtype == igmp.IGMP_TYPE_QUERY:
+            return self.add_router_port(dp, in_port)
+        if msg.msgtype in [igmp.IGMP_TYPE_REPORT_V1, igmp.IGMP_TYPE_REPORT_V2]:
+            return self.join(dp, in_port, msg.address)
+        if msg.msgtype == igmp.IGMP_TYPE_LEAVE:
+            return self.leave(dp, in_port, msg.address)
+        return set()
+
+    def handle_mld(self, dp, in_port, icmp6):
+        "Update memberships from an MLD message, returns the changed groups"
+
+        if icmp6.type_ == icmpv6.MLD_LISTENER_QUERY:
+            return self.add_router_port(dp, in_port)
+        if icmp6.type_ == icmpv6.MLD_LISTENER_REPOR:
+            return self.join(dp, in_port, icmp6.data.address)
+        if icmp6.type_ == icmpv6.MLD_LISTENER_DONE:
+            return self.leave(dp, in_port, icmp6.data.address)
+        if icmp6.type_ == icmpv6.MLDV2_LISTENER_REPORT:
+            records = [(r.type_, r.num, r.address) for r in icmp6.data.records]
+            return self.handle_records(dp, in_port, records)
+        return set()
+
+    def handle_records(self, dp, in_port, records):
+        "Handle IGMPv3/MLDv2 (type, number of sources, address) group records"
+
+        changed = set()
+        for record_type, num, address in records:
+            if record_type in JOIN_RECORDS or \
+               (num and record_type in SOURCE_RECORDS):
+                changed |= self.join(dp, in_port, address)
+            elif record_type in LEAVE_RECORDS:
+                changed |= self.leave(dp, in_port, address)
+        return changed
+
+    def join(self, dp, in_port, address):
+        "Add in_port to the group for address"
+
+        group = multicast_mac(address)
+        if group.startswith(FLOODED_PREFIXES):
+            return set()
+        if self.groups.join(dp.id, group, in_port):
+            return set([group])
+        return set()
+
+    def leave(self, dp, in_port, address):
+        "Remove in_port from the group for address"
+
+        group = multicast_mac(address)
+        delay = self.config.last_member_timeout
+        if self.config.fast_leave:
+            delay = 0
+        if self.groups.leave(dp.id, group, in_port, delay):
+            return set([group])
+        return set()
+
+    def add_router_port(self, dp, in_port):
+        "Add in_port as a multicast router port, returns the changed groups"
+
+        if self.groups.add_router_port(dp.id, in_port):
+            return set(self.groups.groups(dp.id))
+        return set()
+
+    def update_group_flow(self, dp, group):
+        "Forward the group to its current ports, or remove it without members"
+
+        match = self.match(dp, eth_dst=group)
+        ports = self.groups.ports(dp.id, group)
+        if not ports:
+            return [self.flowdel(dp, self.config.table_eth_dst, match=match)]
+
+        actions = [self.action_output(dp, port) for port in ports]
+        instructions = [self.apply_actions(dp, actions)]
+        return [self.flowmod(dp, self.config.table_eth_dst,
+                             match=match,
+                             priority=self.config.priority_group,
+                             instructions=instructions)]
+
+    def expire_loop(self):
+        "Periodically expire memberships and router ports"
+
+        while True:
+            for dpid, group in self.groups.expire():
+                dp = self.datapaths.get(dpid, None)
+                if dp != None:
+                    self.send_msgs(dp, self.update_group_flow(dp, group))
+            hub.sleep(self.config.expire_interval)
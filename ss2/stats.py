@@ -0,0 +1,183 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Flow statistics tracking for Simple Switch 2.0 (SS2)
+"""
+
+import logging
+import time
+
+class HostActivity(object):
+    """Derives per host learn timeouts from flow stats packet counts
+
+    Packet counts of the flows for a host are turned in to a smoothed packet
+    rate, the highest of its rates in the polled tables. Hosts at or above
+    busy_rate get max_timeout, idle hosts get min_timeout and everything else
+    is scaled linearly in between.
+    """
+
+    def __init__(self, min_timeout, max_timeout, busy_rate, smoothing=0.5):
+        # {(dpid, mac, table_id): (packet_count, timestamp)}
+        self.counters = {}
+        # {(dpid, mac): smoothed packets per second}
+        self.rates = {}
+        self.logger = logging.getLogger("SS2HostActivity")
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.busy_rate = float(busy_rate)
+        self.smoothing = smoothing
+
+    def update(self, dpid, tables, curtime=None):
+        """Update rates from a full flow stats poll of the host flow tables
+
+        tables is a dict of {table_id: {host: packet_count}}, where host is
+        any key for the host such as a (mac, vid) tuple. Hosts missing from a
+        table no longer have a flow in it and are forgotten for that table.
+        Every host gets one smoothed rate per poll, so the rate does not swing
+        with the order the tables are polled in. Returns the list of hosts
+        that saw traffic since the last poll.
+        """
+
+        curtime = curtime or time.time()
+        active = set()
+        deltas = {}
+        for table_id, counts in tables.items():
+            for mac, packet_count in counts.items():
+                old = self.counters.get((dpid, mac, table_id), None)
+                self.counters[(dpid, mac, table_id)] = (packet_count, curtime)
+                if old == None:
+                    continue
+                old_count, timestamp = old
+                # A lower count means the flow was reinstalled since the last
+                # poll
+                delta = packet_count - old_count
+                if delta < 0:
+                    delta = packet_count
+                if delta:
+                    active.add(mac)
+                rate = delta / max(curtime - timestamp, 1e-3)
+                deltas[mac] = max(deltas.get(mac, 0), rate)
+
+            for key in list(self.counters.keys()):
+                if key[0] == dpid and key[2] == table_id and \
+                   key[1] not in counts:
+                    del self.counters[key]
+
+        for mac, rate in deltas.items():
+            old_rate = self.rates.get((dpid, mac), rate)
+            self.rates[(dpid, mac)] = (self.smoothing * rate +
+                                       (1 - self.smoothing) * old_rate)
+
+        # Forget rates of hosts without flows in any table
+        hosts = set((key[0], key[1]) for key in self.counters)
+        for key in list(self.rates.keys()):
+            if key[0] == dpid and key not in hosts:
+                del self.rates[key]
+
+        return list(active)
+
+    def timeout(self, dpid, mac, default):
+        "Returns the learn timeout for the host, default if it has no rate"
+
+        rate = self.rates.get((dpid, mac), None)
+        if rate == None:
+            return default
+        scale = min(rate / self.busy_rate, 1.0)
+        return int(self.min_timeout +
+                   (self.max_timeout - self.min_timeout) * scale)
+
+    def remove_datapath(self, dpid):
+        "Forget all hosts on dpid"
+
+        for key in list(self.counters.keys()):
+            if key[0] == dpid:
+                del self.counters[key]
+        for key in list(self.rates.keys()):
+            if key[0] == dpid:
+                del self.rates[key]
+
+class RuleCounters(object):
+    """Aggregates the hit counters of ACL rules over all datapaths
+
+    Every full poll of a datapath replaces the packet and byte counts of its
+    rules. Rates are derived from successive polls of the same datapath, so
+    they cover the last poll interval of each datapath.
+    """
+
+    def __init__(self):
+        # {(dpid, rule): (packet_count, byte_count, timestamp)}
+        self.counters = {}
+        # {(dpid, rule): (packets per second, bytes per second)}
+        self.rates = {}
+
+    def update(self, dpid, counts, curtime=None):
+        """Update the counters of dpid from a full flow stats poll
+
+        counts is a dict of {rule: (packet_count, byte_count)}. Rules missing
+        from counts no longer have flows on dpid and are forgotten for it.
+        """
+
+        curtime = curtime or time.time()
+        for rule, (packet_count, byte_count) in counts.items():
+            old = self.counters.get((dpid, rule), None)
+            self.counters[(dpid, rule)] = (packet_count, byte_count, curtime)
+            if old == None:
+                continue
+            old_packets, old_bytes, timestamp = old
+            # Lower counts mean the flows were reinstalled since the last poll
+            if packet_count < old_packets or byte_count < old_bytes:
+                old_packets, old_bytes = 0, 0
+            elapsed = max(curtime - timestamp, 1e-3)
+            self.rates[(dpid, rule)] = ((packet_count - old_packets) / elapsed,
+                                        (byte_count - old_bytes) / elapsed)
+
+        for key in list(self.counters.keys()):
+            if key[0] == dpid and key[1] not in counts:
+                del self.counters[key]
+                self.rates.pop(key, None)
+
+    def remove_datapath(self, dpid):
+        "Forget the counters of dpid"
+
+        self.update(dpid, {})
+
+    def totals(self):
+        """Returns the counters of every rule summed over all datapaths
+
+        Returns a dict of {rule: dict} with the packet_count, byte_count,
+        packet_rate and byte_rate of the rule and the number of datapaths
+        polled for it. Rates are None until a rule was polled twice.
+        """
+
+        totals = {}
+        for (dpid, rule), counter in self.counters.items():
+            total = totals.setdefault(rule, {
+                'packet_count': 0, 'byte_count': 0, 'packet_rate': None,
+                'byte_rate': None, 'datapaths': 0})
+            total['packet_count'] += counter[0]
+            total['byte_count'] += counter[1]
+            total['datapaths'] += 1
+            rates = self.rates.get((dpid, rule), None)
+            if rates != None:
+                total['packet_rate'] = (total['packet_rate'] or 0) + rates[0]
+                total['byte_rate'] = (total['byte_rate'] or 0) + rates[1]
+        return totals
@@ -0,0 +1,53 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test the datapath admission control"
+
+import unittest
+from ss2 import admission
+
+# pylint: disable=C0111
+
+class AdmissionSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.admission = admission.AdmissionScheduler(concurrency=2,
+                                                      timeout=10)
+
+    def test_concurrency(self):
+        self.assertEqual(self.admission.add(1), [1])
+        self.assertEqual(self.admission.add(2), [2])
+        self.assertEqual(self.admission.add(3), [])
+        self.assertFalse(self.admission.is_admitted(3))
+        self.assertEqual(self.admission.done(1), [3])
+        self.assertEqual(self.admission.done(1), [])
+        self.assertTrue(self.admission.is_admitted(1))
+        self.assertEqual(self.admission.remove(2), [])
+        self.assertTrue(self.admission.is_busy())
+        self.admission.done(3)
+        self.assertFalse(self.admission.is_busy())
+        self.assertEqual(self.admission.last_burst[0], 2)
+
+    def test_expire(self):
+        self.admission.add(1)
+        self.admission.add(2)
+        self.admission.add(3)
+        self.admission.active[1] -= 20
+        self.assertEqual(self.admission.expire(), ([1], [3]))
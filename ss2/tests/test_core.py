@@ -0,0 +1,264 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test the messages SS2Core sends to a datapath"
+
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+from ss2 import core, shard, vlan
+from ryu.lib.packet import arp, ethernet, ether_types as ether, packet
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+# pylint: disable=C0111
+
+class _Datapath(object):
+    "Records the messages SS2Core sends to a connected datapath"
+    ofproto = ofproto_v1_3
+    ofproto_parser = ofproto_v1_3_parser
+
+    def __init__(self, dpid=1):
+        self.id = dpid
+        self.sent = []
+        self.xid = 0
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        self.sent.append(msg)
+
+    def roles(self):
+        return [msg.role for msg in self.sent
+                if isinstance(msg, ofproto_v1_3_parser.OFPRoleRequest)]
+
+class _Event(object):
+    "Stands in for a Ryu event or message with the attributes given"
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class AddressProxyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.core = core.SS2Core()
+        self.core.config.address_proxy = True
+        self.dp = _Datapath()
+        self.core.addresses.update("10.0.0.2", 1, 2, "00:00:00:00:00:02")
+
+    def request(self, dst_ip):
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet(dst="ff:ff:ff:ff:ff:ff",
+                                           src="00:00:00:00:00:01",
+                                           ethertype=ether.ETH_TYPE_ARP))
+        pkt.add_protocol(arp.arp(opcode=arp.ARP_REQUEST,
+                                 src_mac="00:00:00:00:00:01",
+                                 src_ip="10.0.0.1",
+                                 dst_mac="00:00:00:00:00:00",
+                                 dst_ip=dst_ip))
+        pkt.serialize()
+        self.core.handle_address_request(self.dp, 1, pkt)
+        self.assertEqual(len(self.dp.sent), 1)
+        return self.dp.sent[0]
+
+    def test_reply(self):
+        msg = self.request("10.0.0.2")
+        # Output to the in_port of the packet-out would be dropped
+        self.assertEqual(msg.in_port, ofproto_v1_3.OFPP_CONTROLLER)
+        self.assertEqual([action.port for action in msg.actions], [1])
+        reply = packet.Packet(msg.data).get_protocol(arp.arp)
+        self.assertEqual(reply.opcode, arp.ARP_REPLY)
+        self.assertEqual(reply.src_mac, "00:00:00:00:00:02")
+        self.assertEqual(reply.dst_ip, "10.0.0.1")
+
+    def test_flood(self):
+        msg = self.request("10.0.0.3")
+        # Flooding must not send the request back out of its own port
+        self.assertEqual(msg.in_port, 1)
+        self.assertEqual([action.port for action in msg.actions],
+                         [ofproto_v1_3.OFPP_FLOOD])
+        request = packet.Packet(msg.data).get_protocol(arp.arp)
+        self.assertEqual(request.opcode, arp.ARP_REQUEST)
+
+class LinkDiscoveryTestCase(unittest.TestCase):
+    "A tree of s1 with s2 behind its port 1 and s3 behind its port 2"
+
+    def setUp(self):
+        self.core = core.SS2Core()
+        self.core.config.topology_mode = "lldp"
+        self.dps = dict((dpid, _Datapath(dpid)) for dpid in [1, 2, 3])
+        self.core.datapaths.update(self.dps)
+        self.core.topology.add_link(1, 2, 3, 1)
+        self.mac = "00:00:00:00:00:01"
+
+    def packet_in(self, dpid, in_port):
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet(dst="ff:ff:ff:ff:ff:ff",
+                                           src=self.mac, ethertype=0x88b5))
+        pkt.serialize()
+        msg = _Event(datapath=self.dps[dpid], cookie=self.core.config.cookie,
+                     match={'in_port': in_port}, table_id=0, data=pkt.data)
+        self.core.packet_in_handler(_Event(msg=msg))
+
+    def eth_dst_ports(self, dpid):
+        "Output ports of the table_eth_dst flows added for the host"
+        return [msg.instructions[0].actions[0].port
+                for msg in self.dps[dpid].sent
+                if isinstance(msg, ofproto_v1_3_parser.OFPFlowMod) and
+                msg.table_id == self.core.config.table_eth_dst and
+                msg.command == ofproto_v1_3.OFPFC_ADD and
+                msg.match.get('eth_dst', None) == self.mac]
+
+    def test_learned_on_link(self):
+        # The host on s2 port 1 floods to s1 before the s1-s2 link is known
+        self.packet_in(2, 1)
+        self.packet_in(1, 1)
+        probe = self.core.lldp_packet_out(self.dps[2], 3,
+                                          "00:00:00:00:02:03")[0]
+        for dp in self.dps.values():
+            del dp.sent[:]
+        self.core.handle_lldp(self.dps[1], 1, packet.Packet(probe.data))
+
+        self.assertEqual(list(self.core.hosts[(self.mac, None)]), [(2, 1)])
+        # Only the edge location is distributed, s2 keeps its own flow
+        self.assertEqual(self.eth_dst_ports(1), [1])
+        self.assertEqual(self.eth_dst_ports(3), [1])
+        self.assertEqual(self.eth_dst_ports(2), [])
+        self.assertEqual(self.core.learned.get(2, self.mac).port, 1)
+
+        # Distributing again must not bring the stale location back
+        self.core.distribute_hosts()
+        self.assertEqual(self.eth_dst_ports(2), [])
+
+    def test_installed_timeout(self):
+        self.packet_in(2, 1)
+        # As adaptive timeouts would for an active host
+        installed = self.core.learned.get(2, self.mac)
+        installed.timeout = 1800
+        installed.timestamp -= self.core.config.learn_timeout + 1
+        self.core.distribute_hosts()
+        self.assertIn((self.mac, None), self.core.hosts)
+
+        installed.timestamp -= 1800
+        self.core.distribute_hosts()
+        self.assertNotIn((self.mac, None), self.core.hosts)
+
+class VlanFlowsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.core = core.SS2Core()
+        self.core.config.vlan_mode = True
+        self.core.vlans = vlan.VlanMap(vlan.parse_vlan_ports("1:1=10"),
+                                       vlan.parse_vlan_ports("1:3=10/20"),
+                                       native=1)
+        self.dp = _Datapath()
+
+    def flows(self, **kwargs):
+        "Returns the flows of add_vlan_flows matching all of kwargs"
+        return [msg for msg in self.core.add_vlan_flows(self.dp)
+                if all(msg.match.get(field, None) == value
+                       for field, value in kwargs.items())]
+
+    def test_untagged(self):
+        ofp = ofproto_v1_3
+        # Untagged packets on a trunk port are not in the native VLAN
+        flows = self.flows(in_port=3, vlan_vid=ofp.OFPVID_NONE)
+        self.assertEqual(len(flows), 1)
+        self.assertEqual(flows[0].instructions, [])
+        native = self.flows(vlan_vid=ofp.OFPVID_NONE)[-1]
+        self.assertNotIn('in_port', native.match)
+        self.assertGreater(flows[0].priority, native.priority)
+
+class ShardTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, "ss2.state")
+        self.core = core.SS2Core()
+        self.core.config.shard_count = 2
+        self.core.config.shard_id = 0
+        self.core.shared = shard.SharedState(path, 2, 8, timeout=10)
+        self.core.shared.heartbeat(0)
+        # The state of the worker running shard 1
+        self.other = shard.SharedState(path, 2, 8, timeout=10)
+        self.other.heartbeat(1)
+        # A datapath owned by shard 1 while it is alive
+        self.dp = _Datapath(next(
+            dpid for dpid in itertools.count(1)
+            if shard.SharedState.owner(dpid, [0, 1]) == 1))
+
+    def tearDown(self):
+        self.core.shared.close()
+        self.other.close()
+        shutil.rmtree(self.tmpdir)
+
+    def stop_other(self):
+        "Make shard 1 look like it stopped sending heartbeats"
+        shard.HEARTBEAT.pack_into(self.other.map,
+                                  shard.HEADER_SIZE + shard.HEARTBEAT.size, 0)
+
+    def test_takeover(self):
+        self.core.switch_features_handler(
+            _Event(msg=_Event(datapath=self.dp)))
+        self.assertEqual(self.dp.roles(), [ofproto_v1_3.OFPCR_ROLE_SLAVE])
+        self.assertNotIn(self.dp.id, self.core.datapaths)
+
+        self.stop_other()
+        self.core.rebalance_shards()
+        self.assertEqual(self.dp.roles(), [ofproto_v1_3.OFPCR_ROLE_SLAVE,
+                                           ofproto_v1_3.OFPCR_ROLE_MASTER])
+        self.assertIs(self.core.datapaths[self.dp.id], self.dp)
+
+        # Handed back once shard 1 is alive again
+        self.other.heartbeat(1)
+        self.core.rebalance_shards()
+        self.assertEqual(self.dp.roles()[-1], ofproto_v1_3.OFPCR_ROLE_SLAVE)
+        self.assertNotIn(self.dp.id, self.core.datapaths)
+
+    def test_own_datapath(self):
+        self.stop_other()
+        self.core.switch_features_handler(
+            _Event(msg=_Event(datapath=self.dp)))
+        self.assertEqual(self.dp.roles(), [ofproto_v1_3.OFPCR_ROLE_MASTER])
+        self.assertIs(self.core.datapaths[self.dp.id], self.dp)
+
+        # Forgotten everywhere once it disconnects
+        self.core.state_change_handler(_Event(datapath=self.dp))
+        self.assertNotIn(self.dp.id, self.core.datapaths)
+        self.assertNotIn(self.dp.id, self.core.shard_datapaths)
+
+    def test_move(self):
+        mac = "00:00:00:00:00:01"
+        self.other.learn(mac, 1, 7, 3)
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet(dst="00:00:00:00:00:02", src=mac,
+                                           ethertype=0x88b5))
+        pkt.serialize()
+        msg = _Event(datapath=self.dp, cookie=self.core.config.cookie,
+                     match={'in_port': 2}, table_id=0, data=pkt.data)
+        with self.assertLogs(self.core.logger, 'INFO') as logs:
+            self.core.packet_in_handler(_Event(msg=msg))
+        self.assertTrue(any("moved from 7, 3 on shard 1" in line
+                            for line in logs.output))
+        entry = self.core.shared.lookup(mac)
+        self.assertEqual((entry.shard, entry.dpid, entry.port),
+                         (0, self.dp.id, 2))
@@ -0,0 +1,93 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test the pipelined message delivery"
+
+import unittest
+from ss2 import delivery
+
+# pylint: disable=C0111
+
+class _Msg(object):
+    def __init__(self, name):
+        self.name = name
+        self.xid = None
+
+class _Datapath(object):
+    "Records messages sent with the xids Ryu's Datapath would assign"
+    id = 1
+
+    def __init__(self):
+        self.sent = []
+        self.xid = 0
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.xid = self.xid
+        return msg.xid
+
+    def send_msg(self, msg):
+        self.sent.append(msg)
+
+class DeliveryQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dp = _Datapath()
+        self.errors = []
+        self.queue = delivery.DeliveryQueue(self.dp,
+                                            lambda dp: _Msg("barrier"),
+                                            window=4, queue_limit=1,
+                                            timeout=10)
+
+    def send(self, *names):
+        msgs = [_Msg(name) for name in names]
+        return self.queue.send(msgs, names,
+                               lambda *args: self.errors.append(args))
+
+    def test_window(self):
+        self.assertTrue(self.send("a", "b"))
+        self.assertTrue(self.send("c"))
+        self.assertFalse(self.send("d"))
+        self.assertEqual(len(self.dp.sent), 3)
+        self.assertEqual(self.errors, [(("d",), None, None)])
+
+        # Barrier for the first batch lets the queued one through
+        self.assertTrue(self.queue.barrier_reply(3))
+        self.assertEqual([m.name for m in self.dp.sent],
+                         ["a", "b", "barrier", "c", "barrier"])
+        self.assertFalse(self.queue.barrier_reply(3))
+        self.assertTrue(self.queue.barrier_reply(5))
+        self.assertEqual(self.queue.status()['inflight'], 0)
+        self.assertEqual(self.queue.status()['confirmed'], 2)
+
+    def test_error(self):
+        self.send("a", "b")
+        self.assertTrue(self.queue.error(2, "full"))
+        self.assertFalse(self.queue.error(9, "full"))
+        self.assertEqual(len(self.errors), 1)
+        context, msg, error = self.errors[0]
+        self.assertEqual((context, msg.name, error), (("a", "b"), "b", "full"))
+
+    def test_expire(self):
+        self.send("a")
+        next(iter(self.queue.inflight.values())).timestamp -= 20
+        self.queue.expire()
+        self.assertEqual(self.errors, [(("a",), None, None)])
+        self.assertEqual(self.queue.status()['inflight'], 0)
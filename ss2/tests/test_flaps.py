@@ -0,0 +1,58 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test MAC flap damping"
+
+import unittest
+from ss2 import flaps
+
+# pylint: disable=C0111
+
+class FlapDamperTestCase(unittest.TestCase):
+    def setUp(self):
+        self.damper = flaps.FlapDamper(penalty=1000, suppress=2500, reuse=750,
+                                       half_life=15, max_penalty=12000)
+        self.mac = "00:00:00:00:00:01"
+
+    def test_suppress(self):
+        self.assertTrue(self.damper.learn(1, 1, self.mac))
+        self.assertTrue(self.damper.learn(1, 2, self.mac))
+        self.assertTrue(self.damper.learn(1, 1, self.mac))
+        # Third flap reaches the suppress threshold, host stays pinned
+        self.assertFalse(self.damper.learn(1, 2, self.mac))
+        self.assertTrue(self.damper.learn(1, 1, self.mac))
+        self.assertEqual(self.damper.reuse_time(1, self.mac), 30)
+        state = self.damper.state()
+        self.assertEqual(len(state), 1)
+        self.assertTrue(state[0]['suppressed'])
+        self.assertEqual(state[0]['flaps'], 3)
+
+    def test_reuse(self):
+        for port in [1, 2, 1, 2]:
+            self.damper.learn(1, port, self.mac)
+        self.damper.entries[(1, self.mac, None)].timestamp -= 45
+        self.assertTrue(self.damper.learn(1, 2, self.mac))
+        self.assertEqual(self.damper.reuse_time(1, self.mac), 0)
+
+    def test_clean(self):
+        self.damper.learn(1, 1, self.mac)
+        self.damper.clean_entries()
+        self.assertEqual(self.damper.state(), [])
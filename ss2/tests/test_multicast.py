@@ -0,0 +1,69 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test the multicast group membership"
+
+import unittest
+from ss2 import multicast
+
+# pylint: disable=C0111
+
+class MulticastMacTestCase(unittest.TestCase):
+    def test_ipv4(self):
+        self.assertEqual(multicast.multicast_mac("239.129.2.3"),
+                         "01:00:5e:01:02:03")
+
+    def test_ipv6(self):
+        self.assertEqual(multicast.multicast_mac("ff05::1:3"),
+                         "33:33:00:01:00:03")
+
+class MulticastGroupsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.groups = multicast.MulticastGroups(timeout=10, router_timeout=10)
+        self.group = "01:00:5e:01:02:03"
+        self.groups.join(1, self.group, 2)
+        self.groups.join(1, self.group, 3)
+
+    def test_ports(self):
+        self.assertFalse(self.groups.join(1, self.group, 2))
+        self.assertTrue(self.groups.add_router_port(1, 9))
+        self.assertEqual(self.groups.ports(1, self.group), [2, 3, 9])
+        self.assertEqual(self.groups.ports(2, self.group), [])
+
+    def test_leave(self):
+        self.assertTrue(self.groups.leave(1, self.group, 2))
+        self.assertFalse(self.groups.leave(1, self.group, 2))
+        self.assertFalse(self.groups.leave(1, self.group, 3, delay=-1))
+        self.assertEqual(self.groups.expire(), set([(1, self.group)]))
+        self.assertEqual(self.groups.groups(1), [])
+
+    def test_expire(self):
+        self.groups.add_router_port(1, 9)
+        self.groups.add_router_port(1, 8, static=True)
+        for entry in self.groups.members[(1, self.group)]:
+            self.groups.members[(1, self.group)][entry] -= 20
+        self.groups.routers[1][9] -= 20
+        self.groups.expiry = [(e[0] - 20,) + e[1:]
+                              for e in self.groups.expiry]
+        # Refreshed membership is not expired by its old heap entry
+        self.groups.join(1, self.group, 3)
+        self.assertEqual(self.groups.expire(), set([(1, self.group)]))
+        self.assertEqual(self.groups.ports(1, self.group), [3, 8])
@@ -0,0 +1,92 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test the shared state of the sharded mode"
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from ss2 import shard
+
+# pylint: disable=C0111
+
+class SharedStateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "ss2.state")
+        # Two workers sharing the same state file
+        self.states = [shard.SharedState(self.path, 2, 8, timeout=10)
+                       for _ in range(2)]
+
+    def tearDown(self):
+        for state in self.states:
+            state.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_learn(self):
+        mac = "00:00:00:00:00:01"
+        self.assertIsNone(self.states[0].learn(mac, 0, 1, 1))
+        previous = self.states[1].learn(mac, 1, 2, 3)
+        self.assertEqual((previous.shard, previous.dpid, previous.port),
+                         (0, 1, 1))
+        entry = self.states[0].lookup(mac)
+        self.assertEqual((entry.shard, entry.dpid, entry.port), (1, 2, 3))
+        self.assertIsNone(self.states[0].lookup("00:00:00:00:00:02"))
+
+    def test_full(self):
+        for i in range(1, 9):
+            self.states[0].learn("00:00:00:00:00:%02x" % i, 0, 1, i)
+        self.assertIsNone(self.states[1].learn("00:00:00:00:01:00", 1, 1, 1))
+        self.assertIsNone(self.states[1].lookup("00:00:00:00:01:00"))
+        self.assertEqual(self.states[1].lookup("00:00:00:00:00:07").port, 7)
+
+    def test_heartbeat(self):
+        self.assertEqual(self.states[0].alive_shards(), [])
+        self.states[1].heartbeat(1)
+        self.assertEqual(self.states[0].alive_shards(), [1])
+        generation = self.states[0].next_generation()
+        self.assertEqual(self.states[1].next_generation(), generation + 1)
+
+    def test_owner(self):
+        owners = dict((dpid, shard.SharedState.owner(dpid, [0, 1, 2]))
+                      for dpid in range(1, 100))
+        self.assertEqual(set(owners.values()), set([0, 1, 2]))
+        # Only datapaths of the missing shard move
+        for dpid, owner in owners.items():
+            new_owner = shard.SharedState.owner(dpid, [0, 2])
+            if owner != 1:
+                self.assertEqual(new_owner, owner)
+            else:
+                self.assertIn(new_owner, [0, 2])
+
+    def test_mismatch(self):
+        with self.assertRaises(ValueError):
+            shard.SharedState(self.path, 3, 8, timeout=10)
+
+class SupervisorTestCase(unittest.TestCase):
+    def test_unsharded_apps(self):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr, \
+             self.assertRaises(SystemExit):
+            shard.main(["ss2.core", "ss2.acl"])
+        self.assertIn("ss2.acl cannot run sharded", stderr.getvalue())
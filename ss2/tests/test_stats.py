@@ -0,0 +1,101 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test the flow statistics tracking"
+
+import unittest
+from ss2 import stats
+
+# pylint: disable=C0111
+
+class HostActivityTestCase(unittest.TestCase):
+    def setUp(self):
+        self.activity = stats.HostActivity(min_timeout=60, max_timeout=1800,
+                                           busy_rate=10, smoothing=1)
+        self.busy = "00:00:00:00:00:01"
+        self.idle = "00:00:00:00:00:02"
+
+    def test_timeout(self):
+        self.assertEqual(self.activity.timeout(1, self.busy, 300), 300)
+        counts = {self.busy: 0, self.idle: 5}
+        self.assertEqual(self.activity.update(1, {103: counts}, 100), [])
+        counts = {self.busy: 500, self.idle: 5}
+        active = self.activity.update(1, {103: counts}, 110)
+        self.assertEqual(active, [self.busy])
+        self.assertEqual(self.activity.timeout(1, self.busy, 300), 1800)
+        self.assertEqual(self.activity.timeout(1, self.idle, 300), 60)
+
+        counts = {self.busy: 550}
+        self.activity.update(1, {103: counts}, 120)
+        self.assertEqual(self.activity.timeout(1, self.busy, 300), 930)
+        self.assertEqual(self.activity.timeout(1, self.idle, 300), 300)
+
+    def test_reinstalled_flow(self):
+        self.activity.update(1, {103: {self.busy: 500}}, 100)
+        self.activity.update(1, {103: {self.busy: 100}}, 110)
+        self.assertEqual(self.activity.timeout(1, self.busy, 300), 1800)
+
+    def test_tables(self):
+        tables = {102: {self.busy: 0}, 103: {self.busy: 0}}
+        self.activity.update(1, tables, 100)
+        # Busy sending but not receiving, the idle table does not pull the
+        # rate down
+        tables = {102: {self.busy: 500}, 103: {self.busy: 0}}
+        self.assertEqual(self.activity.update(1, tables, 110), [self.busy])
+        self.assertEqual(self.activity.timeout(1, self.busy, 300), 1800)
+        tables = {102: {self.busy: 500}, 103: {self.busy: 100}}
+        self.activity.update(1, tables, 120)
+        self.assertEqual(self.activity.timeout(1, self.busy, 300), 1800)
+        # Forgotten once it has no flow in any table
+        self.activity.update(1, {102: {}, 103: {}}, 130)
+        self.assertEqual(self.activity.timeout(1, self.busy, 300), 300)
+
+class RuleCountersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.counters = stats.RuleCounters()
+        self.counters.update(1, {1: (100, 6400), 2: (0, 0)}, curtime=100)
+        self.counters.update(2, {1: (50, 3200)}, curtime=100)
+
+    def test_totals(self):
+        totals = self.counters.totals()
+        self.assertEqual(totals[1]['packet_count'], 150)
+        self.assertEqual(totals[1]['byte_count'], 9600)
+        self.assertEqual(totals[1]['datapaths'], 2)
+        self.assertIsNone(totals[1]['packet_rate'])
+
+    def test_rates(self):
+        self.counters.update(1, {1: (200, 12800), 2: (0, 0)}, curtime=110)
+        self.counters.update(2, {1: (150, 9600)}, curtime=110)
+        totals = self.counters.totals()
+        self.assertAlmostEqual(totals[1]['packet_rate'], 20)
+        self.assertAlmostEqual(totals[1]['byte_rate'], 1280)
+        self.assertAlmostEqual(totals[2]['packet_rate'], 0)
+
+    def test_reinstalled(self):
+        # Counts restart from zero when the flows are reinstalled
+        self.counters.update(2, {1: (10, 640)}, curtime=110)
+        self.assertAlmostEqual(self.counters.totals()[1]['packet_rate'], 1)
+
+    def test_remove(self):
+        self.counters.update(1, {1: (100, 6400)}, curtime=110)
+        self.assertNotIn(2, self.counters.totals())
+        self.counters.remove_datapath(2)
+        self.assertEqual(self.counters.totals()[1]['datapaths'], 1)
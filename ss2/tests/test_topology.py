@@ -0,0 +1,85 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test the link topology"
+
+import unittest
+from ss2 import topology
+
+# pylint: disable=C0111
+
+class ParseLinksTestCase(unittest.TestCase):
+    def test_parse(self):
+        links = topology.parse_links("1:1-2:3, 0x1:2-3:3,")
+        self.assertEqual(links, [(1, 1, 2, 3), (1, 2, 3, 3)])
+
+    def test_empty(self):
+        self.assertEqual(topology.parse_links(""), [])
+
+class TopologyTestCase(unittest.TestCase):
+    def setUp(self):
+        # Tree of depth 2 with an extra redundant link from s2 to s3:
+        #   s1:1 - s2:3, s1:2 - s3:3, s2:4 - s3:4
+        self.topo = topology.Topology(timeout=10)
+        self.topo.add_link(1, 1, 2, 3)
+        self.topo.add_link(1, 2, 3, 3)
+        self.topo.add_link(2, 4, 3, 4)
+
+    def test_add_link(self):
+        self.assertFalse(self.topo.add_link(3, 3, 1, 2))
+        self.assertTrue(self.topo.is_link_port(1, 1))
+        self.assertTrue(self.topo.is_link_port(2, 3))
+        self.assertFalse(self.topo.is_link_port(2, 1))
+        self.assertEqual(self.topo.link_ports(3), [3, 4])
+
+    def test_recable(self):
+        self.assertTrue(self.topo.add_link(1, 1, 4, 1))
+        self.assertFalse(self.topo.is_link_port(2, 3))
+        self.assertEqual(self.topo.links[(4, 1)], (1, 1))
+
+    def test_next_hops(self):
+        self.assertEqual(self.topo.next_hops(2), {1: 1, 3: 4})
+        self.topo.remove_link(2, 4)
+        self.assertEqual(self.topo.next_hops(2), {1: 1, 3: 3})
+
+    def test_remove_datapath(self):
+        removed = self.topo.remove_datapath(1)
+        self.assertEqual(sorted(removed), [(1, 1), (1, 2), (2, 3), (3, 3)])
+        self.assertEqual(self.topo.link_ports(2), [4])
+
+    def test_expire(self):
+        self.topo.add_link(4, 1, 1, 3, static=True)
+        for end in list(self.topo.timestamps):
+            if self.topo.timestamps[end] != None:
+                self.topo.timestamps[end] -= 20
+        self.topo.add_link(1, 1, 2, 3)
+        removed = self.topo.expire_links()
+        self.assertEqual(sorted(removed), [(1, 2), (2, 4), (3, 3), (3, 4)])
+        self.assertTrue(self.topo.is_link_port(1, 1))
+        self.assertTrue(self.topo.is_link_port(4, 1))
+
+    def test_spanning_tree(self):
+        tree = self.topo.spanning_tree()
+        self.assertEqual(tree, set([(1, 1), (2, 3), (1, 2), (3, 3)]))
+
+        # A separate group of datapaths gets its own tree
+        self.topo.add_link(5, 1, 6, 1)
+        self.assertIn((6, 1), self.topo.spanning_tree())
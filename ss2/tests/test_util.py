@@ -0,0 +1,165 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test the utility classes"
+
+import time
+import unittest
+from ss2 import util
+
+# pylint: disable=C0111
+
+class ParsePortsTestCase(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(util.parse_ports("1:1, 0x2:3"), [(1, 1), (2, 3)])
+        self.assertEqual(util.parse_ports(""), [])
+
+class AddressTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.table = util.AddressTable(timeout=10)
+        self.table.update("10.0.0.1", 1, 1, "00:00:00:00:00:01")
+        self.table.update("10.0.0.2", 2, 1, "00:00:00:00:00:02")
+
+    def test_lookup(self):
+        self.assertEqual(self.table.lookup("10.0.0.1").mac,
+                         "00:00:00:00:00:01")
+        self.assertIsNone(self.table.lookup("10.0.0.3"))
+
+    def test_expire(self):
+        self.table.table[("10.0.0.1", None)].timestamp -= 20
+        self.table.table[("10.0.0.2", None)].timestamp -= 20
+        self.table.update("10.0.0.1", 1, 2, "00:00:00:00:00:01")
+        self.assertIsNone(self.table.lookup("10.0.0.2"))
+        self.assertEqual(self.table.lookup("10.0.0.1").port, 2)
+
+    def test_remove_datapath(self):
+        self.table.remove_datapath(2)
+        self.assertIsNone(self.table.lookup("10.0.0.2"))
+        self.assertIsNotNone(self.table.lookup("10.0.0.1"))
+
+class LearnedHostsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hosts = util.LearnedHosts(timeout=10)
+        for i in range(1, 4):
+            self.hosts.touch(1, i, "00:00:00:00:00:0%d" % i)
+
+    def test_evict(self):
+        # Refresh the first host so the second is least recently active
+        self.hosts.touch(1, 1, "00:00:00:00:00:01")
+        evicted = self.hosts.evict(1, 3)
+        self.assertEqual([e.mac for e in evicted], ["00:00:00:00:00:02"])
+        self.assertEqual(self.hosts.count(1), 2)
+        self.assertEqual(self.hosts.evict(1, 3), [])
+
+    def test_move(self):
+        entry = self.hosts.touch(1, 5, "00:00:00:00:00:01")
+        self.assertEqual(entry.port, 5)
+        self.assertIs(self.hosts.get(1, "00:00:00:00:00:01"), entry)
+        self.assertEqual(self.hosts.count(1), 3)
+
+    def test_expire(self):
+        self.hosts.touch(1, 2, "00:00:00:00:00:02", timeout=60)
+        self.hosts.clean_entries(1, time.time() + 20)
+        self.assertIsNone(self.hosts.get(1, "00:00:00:00:00:01"))
+        self.assertEqual(self.hosts.count(1), 1)
+        # Expires with the timeout of its flows, not the default timeout
+        self.assertEqual(self.hosts.get(1, "00:00:00:00:00:02").timeout, 60)
+        self.hosts.clean_entries(1, time.time() + 70)
+        self.assertEqual(self.hosts.count(1), 0)
+
+class LearnedHostsIterateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hosts = util.LearnedHosts(timeout=10)
+        for dpid in [2, 1]:
+            for i in [3, 1, 2]:
+                self.hosts.touch(dpid, i % 2, "00:00:00:00:00:0%d" % i)
+
+    def keys(self, **kwargs):
+        return [(e.dpid, e.mac) for e in self.hosts.iterate(**kwargs)]
+
+    def test_order(self):
+        keys = self.keys()
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(keys), 6)
+
+    def test_filter(self):
+        self.assertEqual(self.keys(dpid=2, port=0),
+                         [(2, "00:00:00:00:00:02")])
+        self.assertEqual(self.keys(mac="00:00:00:00:00:03"),
+                         [(1, "00:00:00:00:00:03"), (2, "00:00:00:00:00:03")])
+        self.assertEqual(self.keys(dpid=3), [])
+
+    def test_after(self):
+        self.assertEqual(self.keys(after=(1, "00:00:00:00:00:03")),
+                         self.keys(dpid=2))
+        iterator = self.hosts.iterate()
+        next(iterator)
+        # Hosts removed while iterating are skipped
+        self.hosts.remove(1, "00:00:00:00:00:02")
+        self.assertEqual([e.mac for e in iterator][0], "00:00:00:00:00:03")
+
+    def test_pause(self):
+        entries = list(self.hosts.iterate(port=1, pause=2))
+        self.assertEqual([e for e in entries if e != None],
+                         list(self.hosts.iterate(port=1)))
+        # Every host looked at counts, not only the ones yielded
+        self.assertEqual(entries.count(None), 3)
+
+class LearnedHostsVlanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hosts = util.LearnedHosts(timeout=10)
+        self.mac = "00:00:00:00:00:01"
+        self.hosts.touch(1, 1, self.mac, 10)
+        self.hosts.touch(1, 2, self.mac, 20)
+
+    def test_vlans(self):
+        self.assertEqual(self.hosts.count(1), 2)
+        self.assertEqual(self.hosts.get(1, self.mac, 20).port, 2)
+        self.assertIsNone(self.hosts.get(1, self.mac))
+        self.hosts.remove(1, self.mac, 10)
+        self.assertEqual([e.vid for e in self.hosts.iterate()], [20])
+
+    def test_iterate(self):
+        self.assertEqual([e.vid for e in self.hosts.iterate(mac=self.mac)],
+                         [10, 20])
+        self.assertEqual([e.vid for e in self.hosts.iterate(vid=20)], [20])
+        self.assertEqual([e.vid for e in
+                          self.hosts.iterate(after=(1, self.mac, 10))], [20])
+
+    def test_cursor(self):
+        # Hosts with and without a VLAN on the same datapath
+        self.hosts.touch(1, 3, self.mac)
+        self.hosts.touch(1, 3, "00:00:00:00:00:00", 30)
+        self.assertEqual([e.vid for e in self.hosts.iterate(mac=self.mac)],
+                         [None, 10, 20])
+        self.assertEqual([e.vid for e in
+                          self.hosts.iterate(after=(1, self.mac))], [10, 20])
+        self.assertEqual([e.vid for e in
+                          self.hosts.iterate(after=(1, "00:00:00:00:00:00"))],
+                         [30, None, 10, 20])
+
+    def test_index(self):
+        self.hosts.touch(1, 3, self.mac, 10)
+        self.hosts.evict(1, 2)
+        self.hosts.clean_entries(1, time.time() + 20)
+        self.assertEqual(list(self.hosts.iterate()), [])
+        self.hosts.touch(1, 1, self.mac, 10)
+        self.assertEqual([e.port for e in self.hosts.iterate()], [1])
@@ -0,0 +1,55 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"Test the VLAN port map"
+
+import unittest
+from ss2 import vlan
+
+# pylint: disable=C0111
+
+class VlanMapTestCase(unittest.TestCase):
+    def setUp(self):
+        self.vlans = vlan.VlanMap(vlan.parse_vlan_ports("1:1=10, 1:2=20"),
+                                  vlan.parse_vlan_ports("1:3=10/20, 2:1=30"),
+                                  native=1)
+
+    def test_parse(self):
+        self.assertEqual(vlan.parse_vlan_ports("1:3=10/0x14,"),
+                         [(1, 3, [10, 20])])
+        self.assertEqual(vlan.parse_vlan_ports(""), [])
+        with self.assertRaises(ValueError):
+            vlan.VlanMap(vlan.parse_vlan_ports("1:1=10/20"), [], 1)
+
+    def test_classify(self):
+        self.assertEqual(self.vlans.classify(1, 1), 10)
+        self.assertEqual(self.vlans.classify(1, 3, 20), 20)
+        self.assertEqual(self.vlans.classify(1, 4), 1)
+        # Tags on access ports and VLANs a trunk does not carry are dropped
+        self.assertIsNone(self.vlans.classify(1, 1, 10))
+        self.assertIsNone(self.vlans.classify(1, 3, 30))
+        self.assertIsNone(self.vlans.classify(1, 3))
+
+    def test_members(self):
+        self.assertEqual(self.vlans.vlans(1), [1, 10, 20])
+        self.assertEqual(self.vlans.vlans(2), [1, 30])
+        self.assertEqual(self.vlans.members(1, 10, [1, 2, 3, 4]), [1, 3])
+        self.assertEqual(self.vlans.members(1, 1, [1, 2, 3, 4]), [4])
@@ -0,0 +1,195 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Link topology of Simple Switch 2.0 (SS2)
+"""
+
+import collections
+import logging
+import time
+
+def parse_links(spec):
+    """Parse a static link specification in to a list of link tuples
+
+    The specification is a comma separated list of `dpid:port-dpid:port`
+    entries. For example: `1:1-2:3, 1:2-3:3`. Returns a list of
+    (dpid, port, peer_dpid, peer_port) tuples.
+    """
+
+    links = []
+    for entry in str(spec).split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        src, dst = entry.split("-")
+        src_dpid, src_port = src.split(":")
+        dst_dpid, dst_port = dst.split(":")
+        links.append((int(src_dpid, 0), int(src_port, 0),
+                      int(dst_dpid, 0), int(dst_port, 0)))
+
+    return links
+
+class Topology(object):
+    "Keeps track of links between datapaths"
+
+    def __init__(self, timeout=None):
+        # Maps (dpid, port) to the (dpid, port) at the other end of the link.
+        # Every link is stored in both directions.
+        self.links = {}
+        # Last time each link end was seen. None for static links which never
+        # expire.
+        self.timestamps = {}
+        self.logger = logging.getLogger("SS2Topology")
+        self.timeout = timeout
+
+    def add_link(self, dpid, port, peer_dpid, peer_port, static=False):
+        "Add or refresh a link, returns True if the link was not known before"
+
+        new = False
+        timestamp = None if static else time.time()
+        ends = [((dpid, port), (peer_dpid, peer_port)),
+                ((peer_dpid, peer_port), (dpid, port))]
+        for end, peer in ends:
+            old_peer = self.links.get(end, None)
+            if old_peer != peer:
+                new = True
+                if old_peer != None:
+                    # Port was re-cabled, drop the stale reverse direction
+                    self._remove_end(old_peer)
+                self.links[end] = peer
+            if self.timestamps.get(end, 0) != None:
+                self.timestamps[end] = timestamp
+
+        if new:
+            self.logger.debug("Link %s:%s <-> %s:%s",
+                              dpid, port, peer_dpid, peer_port)
+        return new
+
+    def _remove_end(self, end):
+        "Remove a single direction of a link"
+
+        self.links.pop(end, None)
+        self.timestamps.pop(end, None)
+
+    def remove_link(self, dpid, port):
+        "Remove the link at dpid/port, returns the list of removed link ends"
+
+        peer = self.links.get((dpid, port), None)
+        if peer == None:
+            return []
+
+        self._remove_end((dpid, port))
+        self._remove_end(peer)
+        self.logger.debug("Unlinked %s:%s <-> %s:%s", dpid, port, *peer)
+        return [(dpid, port), peer]
+
+    def remove_datapath(self, dpid):
+        "Remove all links to dpid, returns the list of removed link ends"
+
+        removed = []
+        for end in list(self.links.keys()):
+            if end[0] == dpid and end in self.links:
+                removed += self.remove_link(*end)
+        return removed
+
+    def expire_links(self):
+        "Remove links not seen within self.timeout, returns removed link ends"
+
+        if self.timeout == None:
+            return []
+
+        curtime = time.time()
+        removed = []
+        for end, timestamp in list(self.timestamps.items()):
+            if timestamp == None or end not in self.links:
+                continue
+            if timestamp + self.timeout < curtime:
+                removed += self.remove_link(*end)
+        return removed
+
+    def is_link_port(self, dpid, port):
+        "Check if the port on the datapath connects to another datapath"
+
+        return (dpid, port) in self.links
+
+    def link_ports(self, dpid):
+        "Returns the sorted ports on dpid that connect to other datapaths"
+
+        return sorted(port for (_dpid, port) in self.links if _dpid == dpid)
+
+    def next_hops(self, dpid):
+        """Find the port on every other datapath that leads toward dpid
+
+        Returns a dict of {dpid: port} using shortest paths. When there are
+        several equal paths, the lowest dpid and port is used so that the
+        result is stable between calls.
+        """
+
+        adjacent = {}
+        for (src, src_port), (dst, _dst_port) in self.links.items():
+            adjacent.setdefault(dst, []).append((src, src_port))
+
+        hops = {}
+        visited = set([dpid])
+        queue = collections.deque([dpid])
+        while queue:
+            current = queue.popleft()
+            for neighbor, port in sorted(adjacent.get(current, [])):
+                if neighbor in visited:
+                    continue
+                visited.add(neighbor)
+                hops[neighbor] = port
+                queue.append(neighbor)
+
+        return hops
+
+    def spanning_tree(self):
+        """Find a spanning tree over all linked datapaths
+
+        Returns the set of (dpid, port) link ends that are part of the tree.
+        Link ends not in the set are redundant and should not be flooded to.
+        The tree is rooted at the lowest dpid of each connected group of
+        datapaths.
+        """
+
+        adjacent = {}
+        for (src, src_port), (dst, dst_port) in self.links.items():
+            adjacent.setdefault(src, []).append((dst, src_port, dst_port))
+
+        tree = set()
+        visited = set()
+        for root in sorted(adjacent):
+            if root in visited:
+                continue
+            visited.add(root)
+            queue = collections.deque([root])
+            while queue:
+                current = queue.popleft()
+                for neighbor, port, peer_port in sorted(adjacent[current]):
+                    if neighbor in visited:
+                        continue
+                    visited.add(neighbor)
+                    tree.add((current, port))
+                    tree.add((neighbor, peer_port))
+                    queue.append(neighbor)
+
+        return tree
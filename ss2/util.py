@@ -23,18 +23,26 @@
 Utilities for Simple Switch 2.0 (SS2)
 """
 
+import bisect
+import collections
+import heapq
+import itertools
 import logging
 import time
 
-class _HostCacheEntry(object):
+class HostEntry(object):
     "Basic class to hold data on a cached host"
 
-    def __init__(self, dpid, port, mac):
+    def __init__(self, dpid, port, mac, vid=None):
         self.dpid = dpid
         self.port = port
         self.mac = mac
+        # VLAN of the host with VLAN aware learning, None otherwise
+        self.vid = vid
         self.timestamp = time.time()
         self.counter = 0
+        # Timeout of the host's flows on the datapath, if it has any
+        self.timeout = None
 
 class HostCache(object):
     "Keeps track of recently learned hosts to prevent duplicate flowmods"
@@ -44,20 +52,25 @@ class HostCache(object):
         self.logger = logging.getLogger("SS2HostCache")
         self.timeout = timeout
 
-    def is_new_host(self, dpid, port, mac):
+    def is_new_host(self, dpid, port, mac, vid=None):
         "Check if the host/port combination is new and add the host entry"
 
         self.clean_entries()
-        entry = self.cache.get((dpid, port, mac), None)
+        entry = self.cache.get((dpid, port, mac, vid), None)
         if entry != None:
             entry.counter += 1
             return False
 
-        entry = _HostCacheEntry(dpid, port, mac)
-        self.cache[(dpid, port, mac)] = entry
-        self.logger.debug("Learned %s, %s, %s", dpid, port, mac)
+        entry = HostEntry(dpid, port, mac, vid)
+        self.cache[(dpid, port, mac, vid)] = entry
+        self.logger.debug("Learned %s, %s, %s, %s", dpid, port, mac, vid)
         return True
 
+    def forget(self, dpid, port, mac, vid=None):
+        "Remove the host entry so the host is considered new again"
+
+        self.cache.pop((dpid, port, mac, vid), None)
+
     def clean_entries(self):
         "Clean entries older than self.timeout"
 
@@ -65,9 +78,256 @@ class HostCache(object):
         _cleaned_cache = {}
         for host in self.cache.values():
             if host.timestamp + self.timeout >= curtime:
-                _cleaned_cache[(host.dpid, host.port, host.mac)] = host
+                key = (host.dpid, host.port, host.mac, host.vid)
+                _cleaned_cache[key] = host
             else:
                 self.logger.debug("Unlearned %s, %s, %s after %s hits",
                                   host.dpid, host.port, host.mac, host.counter)
 
         self.cache = _cleaned_cache
+
+class LearnedHosts(object):
+    """Keeps track of the hosts with flows on each datapath
+
+    Hosts on each datapath are kept from least to most recently active, so
+    evicting hosts only looks at the oldest entries. Every host expires with
+    the timeout of its flows, pushed on a heap of the datapath so expiring
+    only looks at hosts that are due. Hosts are keyed by MAC and VLAN, the
+    same MAC in two VLANs is two hosts.
+    """
+
+    def __init__(self, timeout):
+        # {dpid: OrderedDict((mac, vid): HostEntry)}
+        self.hosts = {}
+        # {dpid: sorted list of the order of every host}, see _order
+        self.index = {}
+        # {dpid: heap of (expiry, sequence, (mac, vid))}. Entries for hosts
+        # that were refreshed or relearned since are skipped.
+        self.expiry = {}
+        self.sequence = itertools.count()
+        self.logger = logging.getLogger("SS2LearnedHosts")
+        self.timeout = timeout
+
+    def touch(self, dpid, port, mac, vid=None, timeout=None):
+        """Add or refresh a host as the most recently active on dpid
+
+        timeout is the timeout of the flows installed for the host, the
+        default timeout is used if it is not given.
+        """
+
+        hosts = self.hosts.setdefault(dpid, collections.OrderedDict())
+        entry = hosts.pop((mac, vid), None)
+        if entry == None:
+            bisect.insort(self.index.setdefault(dpid, []),
+                          self._order(mac, vid))
+        if entry == None or entry.port != port:
+            entry = HostEntry(dpid, port, mac, vid)
+        else:
+            entry.timestamp = time.time()
+        entry.timeout = timeout or self.timeout
+        hosts[(mac, vid)] = entry
+        self._push(dpid, entry)
+        return entry
+
+    @staticmethod
+    def _order(mac, vid):
+        "Sort key of a host, without a VLAN it sorts before any VLAN"
+
+        return (mac, -1 if vid == None else vid)
+
+    def _unindex(self, dpid, mac, vid):
+        "Remove a host from the sorted index of dpid"
+
+        index = self.index[dpid]
+        del index[bisect.bisect_left(index, self._order(mac, vid))]
+
+    def _push(self, dpid, entry):
+        "Schedule a host to expire once its flows time out"
+
+        heapq.heappush(self.expiry.setdefault(dpid, []),
+                       (entry.timestamp + entry.timeout, next(self.sequence),
+                        (entry.mac, entry.vid)))
+
+    def get(self, dpid, mac, vid=None):
+        "Returns the HostEntry for mac in vid on dpid, or None"
+
+        return self.hosts.get(dpid, {}).get((mac, vid), None)
+
+    def refresh(self, dpid, mac, vid=None):
+        "Mark a known host as the most recently active on dpid"
+
+        hosts = self.hosts.get(dpid, {})
+        entry = hosts.pop((mac, vid), None)
+        if entry != None:
+            entry.timestamp = time.time()
+            hosts[(mac, vid)] = entry
+            self._push(dpid, entry)
+
+    def remove(self, dpid, mac, vid=None):
+        "Forget mac in vid on dpid, returns the removed HostEntry or None"
+
+        entry = self.hosts.get(dpid, {}).pop((mac, vid), None)
+        if entry != None:
+            self._unindex(dpid, mac, vid)
+        return entry
+
+    def remove_datapath(self, dpid):
+        "Forget all hosts on dpid"
+
+        self.hosts.pop(dpid, None)
+        self.index.pop(dpid, None)
+        self.expiry.pop(dpid, None)
+
+    def count(self, dpid):
+        "Number of hosts on dpid"
+
+        return len(self.hosts.get(dpid, {}))
+
+    def iterate(self, dpid=None, port=None, mac=None, vid=None, after=None,
+                pause=None):
+        """Yields the HostEntry matching the filters, ordered by dpid, mac, vid
+
+        after is a (dpid, mac) or (dpid, mac, vid) tuple to continue after,
+        for pagination, a host without a VLAN sorts before the same MAC in any
+        VLAN. Every host is looked up in the sorted index of its datapath
+        from the one before it, so the hosts may change while iterating.
+        Hosts removed in the meantime are skipped.
+
+        With pause, None is also yielded after every pause hosts looked at,
+        matching or not, so callers can let other threads run during long
+        filtered scans.
+        """
+
+        if after != None:
+            after_order = self._order(after[1],
+                                      after[2] if len(after) > 2 else None)
+        dpids = sorted(self.hosts) if dpid == None else [dpid]
+        scanned = 0
+        for _dpid in dpids:
+            if after != None and _dpid < after[0]:
+                continue
+            hosts = self.hosts.get(_dpid, {})
+            index = self.index.get(_dpid, [])
+            if after != None and _dpid == after[0]:
+                last = after_order
+            else:
+                last = None
+            if mac != None and (last == None or last[0] < mac):
+                # Start right before the first host with the MAC
+                last = (mac,)
+            while True:
+                if last == None:
+                    position = 0
+                else:
+                    position = bisect.bisect_right(index, last)
+                if position == len(index):
+                    break
+                last = index[position]
+                scanned += 1
+                if pause and scanned % pause == 0:
+                    yield None
+                if mac != None and last[0] != mac:
+                    break
+                key = (last[0], None if last[1] == -1 else last[1])
+                entry = hosts.get(key, None)
+                if entry == None or (port != None and entry.port != port) or \
+                   (vid != None and entry.vid != vid):
+                    continue
+                yield entry
+
+    def evict(self, dpid, limit):
+        """Make room for one more host on dpid
+
+        Removes the least recently active hosts until there are fewer than
+        limit left, returns the list of evicted HostEntry.
+        """
+
+        hosts = self.hosts.get(dpid, {})
+        evicted = []
+        while hosts and len(hosts) >= limit:
+            key = next(iter(hosts))
+            evicted.append(hosts.pop(key))
+            self._unindex(dpid, *key)
+            self.logger.debug("Evicted %s, %s, %s", dpid, *key)
+        return evicted
+
+    def clean_entries(self, dpid, curtime=None):
+        "Clean entries on dpid not refreshed within the timeout of their flows"
+
+        if curtime == None:
+            curtime = time.time()
+        hosts = self.hosts.get(dpid, {})
+        expiry = self.expiry.get(dpid, [])
+        while expiry and expiry[0][0] < curtime:
+            due, _, key = heapq.heappop(expiry)
+            entry = hosts.get(key, None)
+            if entry != None and entry.timestamp + entry.timeout == due:
+                del hosts[key]
+                self._unindex(dpid, *key)
+
+class AddressTable(object):
+    """Keeps track of IP address to host bindings for the ARP/ND proxy
+
+    Bindings are kept in the order they were last refreshed so expired
+    bindings can be removed from the front without scanning the whole table.
+    With VLAN aware learning each VLAN has its own bindings.
+    """
+
+    def __init__(self, timeout):
+        self.table = collections.OrderedDict()
+        self.logger = logging.getLogger("SS2AddressTable")
+        self.timeout = timeout
+
+    def update(self, ip, dpid, port, mac, vid=None):
+        "Add or refresh the binding of ip in vid to the host at dpid/port/mac"
+
+        old = self.table.pop((ip, vid), None)
+        entry = HostEntry(dpid, port, mac, vid)
+        self.table[(ip, vid)] = entry
+        if old == None or old.mac != mac:
+            self.logger.debug("Bound %s, %s to %s, %s, %s",
+                              ip, vid, dpid, port, mac)
+        return entry
+
+    def lookup(self, ip, vid=None):
+        "Returns the HostEntry bound to ip in vid, None if unknown or expired"
+
+        self.clean_entries()
+        return self.table.get((ip, vid), None)
+
+    def remove_datapath(self, dpid):
+        "Remove all bindings for hosts learned on dpid"
+
+        for key, entry in list(self.table.items()):
+            if entry.dpid == dpid:
+                del self.table[key]
+
+    def clean_entries(self):
+        "Clean entries older than self.timeout"
+
+        curtime = time.time()
+        expired = []
+        for key, entry in self.table.items():
+            if entry.timestamp + self.timeout >= curtime:
+                break
+            expired.append(key)
+
+        for key in expired:
+            del self.table[key]
+            self.logger.debug("Unbound %s, %s", *key)
+
+def parse_ports(spec):
+    """Parse a port list specification in to a list of (dpid, port) tuples
+
+    The specification is a comma separated list of `dpid:port` entries.
+    """
+
+    ports = []
+    for entry in str(spec).split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        dpid, port = entry.split(":")
+        ports.append((int(dpid, 0), int(port, 0)))
+
+    return ports
@@ -0,0 +1,117 @@
+# Copyright (c) 2016 Noviflow
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+VLAN port map of Simple Switch 2.0 (SS2)
+"""
+
+
+def parse_vlan_ports(spec):
+    """Parse a port VLAN specification in to a list of port VLAN tuples
+
+    The specification is a comma separated list of `dpid:port=vid` entries,
+    where several VLANs are separated by `/`. For example: `1:1=10, 1:3=10/20`.
+    Returns a list of (dpid, port, [vid]) tuples.
+    """
+
+    ports = []
+    for entry in str(spec).split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        port, vids = entry.split("=")
+        dpid, port = port.split(":")
+        ports.append((int(dpid, 0), int(port, 0),
+                      [int(vid, 0) for vid in vids.split("/")]))
+
+    return ports
+
+class VlanMap(object):
+    """Keeps track of the VLANs carried by each port
+
+    Access ports carry a single VLAN untagged and trunk ports carry their
+    VLANs tagged. Every other port is an access port of the native VLAN.
+    """
+
+    def __init__(self, access, trunks, native):
+        # {(dpid, port): vid}
+        self.access = {}
+        for dpid, port, vids in access:
+            if len(vids) != 1:
+                raise ValueError("Access port %s:%s needs a single VLAN" %
+                                 (dpid, port))
+            self.access[(dpid, port)] = vids[0]
+        # {(dpid, port): set(vid)}
+        self.trunks = dict(((dpid, port), set(vids))
+                           for dpid, port, vids in trunks)
+        self.native = native
+
+    def classify(self, dpid, port, vid=None):
+        """Returns the VLAN of a packet received at dpid/port
+
+        vid is the VLAN tag of the packet, None if it is untagged. Returns
+        None if the port does not carry the packet's VLAN.
+        """
+
+        if (dpid, port) in self.trunks:
+            return vid if vid in self.trunks[(dpid, port)] else None
+        if vid != None:
+            return None
+        return self.access.get((dpid, port), self.native)
+
+    def is_trunk(self, dpid, port):
+        "Check if the port on the datapath carries its VLANs tagged"
+
+        return (dpid, port) in self.trunks
+
+    def access_ports(self, dpid):
+        "Returns the sorted (port, vid) access ports configured on dpid"
+
+        return sorted((port, vid) for (_dpid, port), vid in self.access.items()
+                      if _dpid == dpid)
+
+    def trunk_ports(self, dpid):
+        "Returns the sorted (port, [vid]) trunk ports configured on dpid"
+
+        return sorted((port, sorted(vids))
+                      for (_dpid, port), vids in self.trunks.items()
+                      if _dpid == dpid)
+
+    def vlans(self, dpid):
+        "Returns the sorted VLANs that may be present on dpid"
+
+        vids = set([self.native])
+        vids.update(vid for port, vid in self.access_ports(dpid))
+        for _port, trunk_vids in self.trunk_ports(dpid):
+            vids.update(trunk_vids)
+        return sorted(vids)
+
+    def members(self, dpid, vid, ports):
+        "Returns the ports of dpid among ports that carry vid"
+
+        members = []
+        for port in ports:
+            if self.is_trunk(dpid, port):
+                if vid in self.trunks[(dpid, port)]:
+                    members.append(port)
+            elif self.classify(dpid, port) == vid:
+                members.append(port)
+        return members